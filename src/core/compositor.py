@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+class Compositor:
+    """
+    Per-job frame compositor. All buffers are allocated once for the output size
+    and every frame is composed in place, so the hot loop does no allocation.
+    compose() returns the internal buffer: it is only valid until the next call.
+    """
+    def __init__(self, w, h, fmt):
+        self.fmt = fmt
+        if fmt == "green":
+            self.out = np.empty((h, w, 3), dtype=np.uint8)
+            self.acc = np.empty((h, w, 3), dtype=np.uint16) # Fixed-point accumulator (x255)
+            self.rnd = np.empty((h, w, 3), dtype=np.uint16)
+            self.inv = np.empty((h, w), dtype=np.uint16)
+        else:
+            self.out = np.empty((h, w, 4), dtype=np.uint8)
+            self.sel = np.empty((h, w), dtype=np.uint8)     # 255 where mask > 0
+            self.sel4 = np.empty((h, w, 4), dtype=np.uint8)
+
+    def compose(self, frame, mask):
+        if self.fmt == "green": return self._green(frame, mask)
+        return self._alpha(frame, mask)
+
+    def _green(self, frame, mask):
+        # out = (frame*m + green*(255-m)) / 255, all in uint16
+        acc = self.acc
+        np.multiply(frame, mask[:,:,None], out=acc, dtype=np.uint16)
+        np.subtract(255, mask, out=self.inv, dtype=np.uint16)
+        np.multiply(self.inv, 255, out=self.inv)
+        np.add(acc[:,:,1], self.inv, out=acc[:,:,1]) # Background is pure green (0,255,0)
+
+        # Rounded division by 255: (x + 128 + ((x + 128) >> 8)) >> 8, max 65407 so no overflow
+        acc += 128
+        np.right_shift(acc, 8, out=self.rnd)
+        acc += self.rnd
+        acc >>= 8
+        np.copyto(self.out, acc, casting="unsafe")
+        return self.out
+
+    def _alpha(self, frame, mask):
+        # BGRA with color zeroed outside the mask (same result as split/and/merge)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=self.out)
+        self.out[:,:,3] = mask
+        cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY, dst=self.sel)
+        cv2.cvtColor(self.sel, cv2.COLOR_GRAY2BGRA, dst=self.sel4)
+        cv2.bitwise_and(self.out, self.sel4, dst=self.out)
+        return self.out
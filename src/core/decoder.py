@@ -0,0 +1,176 @@
+import cv2
+import json
+import os
+import shutil
+import subprocess
+import time
+import numpy as np
+
+# Frame source for every engine: "ffmpeg" (raw pipe, exact counts) or "opencv" (cv2.VideoCapture)
+DECODER = os.environ.get("NAIWEB_DECODER", "ffmpeg")
+
+CHANNELS = {"bgr24": 3, "bgra": 4, "gray": 1}
+
+def probe(path):
+    """
+    Returns {'w', 'h', 'fps', 'frames', 'codec'} for the first video stream (ffprobe also
+    fills 'pix_fmt', 'profile' and 'level', which the OpenCV fallback can't tell).
+    The frame count comes from demuxing every packet, so it is exact (no guessing from duration).
+    """
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+           "-show_entries", "stream=codec_name,pix_fmt,profile,level,width,height,avg_frame_rate,r_frame_rate,nb_read_packets:stream_side_data=rotation",
+           "-of", "json", path]
+    try:
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=300)
+        s = json.loads(res.stdout)["streams"][0]
+        w, h, fps = _geometry(s)
+        return {"w": w, "h": h, "fps": fps, "frames": int(s.get("nb_read_packets", 0)), "codec": s.get("codec_name", ""),
+                "pix_fmt": s.get("pix_fmt", ""), "profile": s.get("profile", ""), "level": int(s.get("level", 0) or 0)}
+    except Exception:
+        return _cv_probe(path)
+
+def probe_header(path):
+    """
+    Same keys as probe() plus 'duration', read from the container header only: instant on any
+    length, but 'frames' is duration x fps (an estimate) when the stream doesn't declare it.
+    """
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "format=duration:stream=codec_name,width,height,avg_frame_rate,r_frame_rate,nb_frames:stream_side_data=rotation",
+           "-of", "json", path]
+    try:
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=60)
+        out = json.loads(res.stdout)
+        s = out["streams"][0]
+        w, h, fps = _geometry(s)
+        dur = float(out.get("format", {}).get("duration", 0) or 0)
+        frames = int(s.get("nb_frames", 0) or 0) or round(dur * fps)
+        return {"w": w, "h": h, "fps": fps, "frames": frames, "codec": s.get("codec_name", ""), "duration": dur}
+    except Exception:
+        info = _cv_probe(path)
+        info["duration"] = info["frames"] / info["fps"]
+        return info
+
+def _geometry(s):
+    # Displayed size (ffmpeg auto-rotates on decode) and frame rate of an ffprobe stream entry
+    w, h = int(s["width"]), int(s["height"])
+    if any(abs(int(d.get("rotation", 0))) in (90, 270) for d in s.get("side_data_list", [])):
+        w, h = h, w
+    fps = 0.0
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        num, _, den = s.get(key, "0/0").partition("/")
+        if float(den or 0) > 0 and float(num) > 0:
+            fps = float(num) / float(den); break
+    return w, h, fps or 30.0
+
+def _cv_probe(path):
+    # No ffprobe (or not a video it understands): ask OpenCV instead
+    cap = cv2.VideoCapture(path)
+    info = {"w": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), "h": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": cap.get(cv2.CAP_PROP_FPS) or 30.0, "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT))}
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode(errors="ignore").strip("\x00").lower()
+    info["codec"] = "h264" if fourcc in ("avc1", "h264", "x264") else fourcc
+    cap.release()
+    return info
+
+def keyframes(path):
+    """Frame indices (presentation order) of the keyframes, from packet flags only (no decoding)."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path]
+    try:
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=300)
+        pkts = []
+        for line in res.stdout.splitlines():
+            pts, _, flags = line.partition(",")
+            try: pkts.append((float(pts), "K" in flags))
+            except ValueError: pass # Packets without pts
+        pkts.sort()
+        return [i for i, (_, key) in enumerate(pkts) if key]
+    except Exception:
+        return []
+
+def open_video(path, start=0, end=None, backend=None, **kwargs):
+    """Opens a frame reader for [start, end) with the configured backend (falls back to OpenCV)."""
+    backend = backend or DECODER
+    if backend == "ffmpeg" and shutil.which("ffmpeg"):
+        # The pipe stops at the probed count (-frames:v): only trust an exact one from ffprobe, never OpenCV's estimate
+        info = kwargs.pop("info", None) or probe(path)
+        if "pix_fmt" in info: return FFmpegReader(path, start, end, info=info, **kwargs)
+    return CvReader(path, start, end)
+
+class FFmpegReader:
+    """
+    Streams rawvideo frames from an ffmpeg subprocess.
+    Decoding is multithreaded inside ffmpeg and frames land directly in NumPy
+    buffers through readinto(); pass `out` to read() to reuse a buffer.
+    `crop` = (x, y, w, h) decodes only that region (frames come out at the crop size).
+    """
+    def __init__(self, path, start=0, end=None, threads=0, pix_fmt="bgr24", info=None, crop=None):
+        info = info or probe(path)
+        self.w, self.h, self.fps = info["w"], info["h"], info["fps"]
+        if crop: self.w, self.h = crop[2], crop[3]
+        end = info["frames"] if end is None or (info["frames"] and end > info["frames"]) else end
+        self.frames = max(0, end - start) if end else 0
+        self.shape = (self.h, self.w, CHANNELS[pix_fmt]) if CHANNELS[pix_fmt] > 1 else (self.h, self.w)
+
+        cmd = ["ffmpeg", "-v", "error", "-threads", str(threads)]
+        # Accurate input seek: half a frame early so float rounding never drops the first frame
+        if start > 0: cmd += ["-ss", f"{max(0.0, (start - 0.5) / self.fps):.6f}"]
+        cmd += ["-i", path, "-map", "0:v:0", "-an", "-sn", "-fps_mode", "passthrough"]
+        if crop: cmd += ["-vf", "crop={2}:{3}:{0}:{1}:exact=1".format(*crop)]
+        if end: cmd += ["-frames:v", str(self.frames)]
+        cmd += ["-f", "rawvideo", "-pix_fmt", pix_fmt, "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+
+    def isOpened(self):
+        return self.proc is not None
+
+    def read(self, out=None):
+        if self.proc is None: return False, None
+        buf = out if out is not None else np.empty(self.shape, dtype=np.uint8)
+        view = memoryview(buf).cast("B")
+        n = 0
+        while n < len(view):
+            r = self.proc.stdout.readinto(view[n:])
+            if not r: return False, None
+            n += r
+        return True, buf
+
+    def release(self):
+        if self.proc is None: return
+        if self.proc.poll() is None: self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+        self.proc = None
+
+class CvReader:
+    """cv2.VideoCapture behind the FFmpegReader interface."""
+    MAX_RETRIES = 5
+
+    def __init__(self, path, start=0, end=None):
+        self.cap = cv2.VideoCapture(path)
+        self.w = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.h = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        end = total if end is None else min(end, total) if total > 0 else end
+        self.frames = max(0, end - start) if end else 0
+        if start > 0: self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        self.pos = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, out=None):
+        if self.frames and self.pos >= self.frames: return False, None
+        for retry in range(self.MAX_RETRIES + 1):
+            ret, frame = self.cap.read(out)
+            if ret:
+                self.pos += 1
+                return True, frame
+            # OpenCV's counts are estimates: only retry when we are clearly not at the end
+            if not self.frames or self.frames - self.pos < 5: break
+            print(f"Warning: Frame read failed at {self.pos}. Retrying ({retry + 1})...")
+            time.sleep(0.1)
+        return False, None
+
+    def release(self):
+        self.cap.release()
@@ -1,7 +1,10 @@
 import cv2
 import numpy as np
-from rembg import remove, new_session
+from rembg import remove
 from src.utils.file_manager import FileManager
+from src.core.matting import upsample_mask, downscale, band_matte
+from src.core.model_registry import REGISTRY
+from src.core.keyers import ChromaKeyer
 
 class ImageEngine:
     def __init__(self, stat_callback=None):
@@ -9,35 +12,49 @@ class ImageEngine:
         self.session = None
         self.curr_model = ""
 
-    def process(self, in_path, model="u2net", fmt="png"):
+    def process(self, in_path, model="u2net", fmt="png", infer_scale=1.0, matting="full", engine="magic", key_color="green", key_tol=40, key_soft=30, spill=1.0):
         try:
             img = cv2.imread(in_path)
             if img is None: return None
             
-            # Session Handling
+            # Chroma key: no model, the screen color is keyed and its spill removed
+            if engine == "chroma":
+                keyer = ChromaKeyer(key_color, key_tol, key_soft, spill)
+                alpha = keyer.matte(img)
+                res = cv2.cvtColor(keyer.despill(img), cv2.COLOR_BGR2BGRA)
+                res[:,:,3] = alpha
+                return self._save(in_path, res, fmt)
+            
+            # Session Handling (shared with the video tab through the registry)
             if self.session is None or self.curr_model != model:
-                if self.stat: self.stat(f"Cargando Modelo {model}...")
-                self.session = new_session(model)
+                self.session = REGISTRY.get(model, self.stat)
                 self.curr_model = model
             
-            # Process
-            res = remove(img, session=self.session, alpha_matting=True)
+            # Process (optionally on a downscaled copy, alpha restored with a guided upsample)
+            # Matting: "full" = rembg closed-form over the whole image, "band" = edge band only
+            res = remove(downscale(img, infer_scale), session=self.session, alpha_matting=(matting == "full"))
+            if res.shape[:2] != img.shape[:2] or matting == "band":
+                alpha = upsample_mask(res[:,:,3], img)
+                if matting == "band": alpha = band_matte(img, alpha)
+                res = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+                res[:,:,3] = alpha
             
-            # Save
-            if fmt == "jpg":
-                # Compose white background for JPG
-                bg = np.zeros_like(res); bg[:] = 255
-                alpha = res[:,:,3] / 255.0
-                fg = res[:,:,:3]
-                comp = (fg * alpha[:,:,None] + bg[:,:,:3] * (1-alpha[:,:,None])).astype(np.uint8)
-                out = FileManager.get_unique_path(in_path, "NoBG", "jpg")
-                cv2.imwrite(out, comp)
-            else:
-                suffix = "NoBG_WebP" if fmt=="webp" else "NoBG"
-                out = FileManager.get_unique_path(in_path, suffix, fmt)
-                cv2.imwrite(out, res)
-                
-            return out
+            return self._save(in_path, res, fmt)
         except Exception as e:
             print(f"Error IMG: {e}")
             return None
+
+    def _save(self, in_path, res, fmt):
+        if fmt == "jpg":
+            # Compose white background for JPG
+            bg = np.zeros_like(res); bg[:] = 255
+            alpha = res[:,:,3] / 255.0
+            fg = res[:,:,:3]
+            comp = (fg * alpha[:,:,None] + bg[:,:,:3] * (1-alpha[:,:,None])).astype(np.uint8)
+            out = FileManager.get_unique_path(in_path, "NoBG", "jpg")
+            cv2.imwrite(out, comp)
+        else:
+            suffix = "NoBG_WebP" if fmt=="webp" else "NoBG"
+            out = FileManager.get_unique_path(in_path, suffix, fmt)
+            cv2.imwrite(out, res)
+        return out
@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+from src.core.decoder import open_video, probe
+
+class BackgroundKeyer:
+    """
+    Matte for static-camera footage: no neural network, just the difference against a
+    background model learned from frames sampled across the clip.
+    "median" builds a temporal-median plate (anything that moves is voted out),
+    "mog2" / "knn" seed OpenCV's subtractors with the samples and then freeze them.
+    The keyer itself is only data (picklable for chunked mode); call worker() once per thread.
+    """
+    def __init__(self, samples, method="median", gain=6.0, morph=5):
+        self.method = method
+        self.gain = gain # Per-channel difference of 255/gain counts as full foreground
+        self.morph = morph
+        if method == "median":
+            self.plate = np.median(np.stack(samples), axis=0).astype(np.uint8)
+            self.samples = None
+        else:
+            self.plate = None
+            self.samples = samples
+
+    @classmethod
+    def from_video(cls, path, method="median", n=25, backend=None, info=None):
+        # Evenly spaced single-frame reads (each one seeks), never the whole clip; probed once for all of them
+        info = info or probe(path)
+        tot = info["frames"]
+        samples = []
+        for i in sorted(set(np.linspace(0, max(tot - 1, 0), n).astype(int))):
+            cap = open_video(path, int(i), int(i) + 1, backend=backend, info=info)
+            ret, f = cap.read()
+            cap.release()
+            if ret: samples.append(f)
+        if not samples: raise ValueError("No se pudieron muestrear cuadros para el fondo")
+        return cls(samples, method)
+
+    def worker(self):
+        return _Subtractor(self)
+
+class _Subtractor:
+    # Per-thread state: OpenCV subtractors are not thread-safe, plates are resized once per input size
+    def __init__(self, keyer):
+        self.k = keyer
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (keyer.morph, keyer.morph))
+        self.size = None
+        self.plate = None
+        self.sub = None
+
+    def _setup(self, size):
+        self.size = size
+        k = self.k
+        if k.method == "median":
+            self.plate = k.plate if k.plate.shape[1::-1] == size else cv2.resize(k.plate, size, interpolation=cv2.INTER_AREA)
+            return
+        make = cv2.createBackgroundSubtractorKNN if k.method == "knn" else cv2.createBackgroundSubtractorMOG2
+        self.sub = make(history=len(k.samples), detectShadows=False)
+        for s in k.samples:
+            self.sub.apply(s if s.shape[1::-1] == size else cv2.resize(s, size, interpolation=cv2.INTER_AREA), learningRate=-1)
+
+    def __call__(self, frame):
+        size = frame.shape[1::-1]
+        if size != self.size: self._setup(size)
+
+        if self.sub is not None:
+            mask = self.sub.apply(frame, learningRate=0) # Frozen: the subject never bleeds into the model
+        else:
+            diff = cv2.absdiff(frame, self.plate).max(axis=2)
+            mask = cv2.convertScaleAbs(diff, alpha=self.k.gain) # 0-255 confidence, thresholded later
+
+        # Open drops sensor-noise specks, close fills holes inside the subject
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel, dst=mask)
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel, dst=mask)
+        return mask
+
+KEY_COLORS = {"green": (64, 177, 0), "blue": (187, 71, 0)} # BGR of standard chroma screens
+
+class ChromaKeyer:
+    """
+    Chroma key for green/blue-screen sources. Alpha comes from the distance to the screen
+    color in the CbCr plane (luma is ignored, so shadows on the screen key out as well):
+    fully transparent within `tol`, fully opaque `soft` beyond it, linear in between.
+    Stateless and vectorized over the whole frame, so one instance serves every worker.
+    """
+    def __init__(self, color="green", tol=40, soft=30, spill=1.0):
+        bgr = KEY_COLORS.get(color, color)
+        ycc = cv2.cvtColor(np.uint8([[bgr]]), cv2.COLOR_BGR2YCrCb)[0, 0]
+        self.cr, self.cb = float(ycc[1]), float(ycc[2])
+        self.ch = int(np.argmax(bgr)) # Channel the screen spills into
+        self.tol, self.soft, self.spill = tol, max(soft, 1), spill
+
+    def matte(self, frame):
+        ycc = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb)
+        cr = ycc[:,:,1].astype(np.float32); cr -= self.cr
+        cb = ycc[:,:,2].astype(np.float32); cb -= self.cb
+        d = cv2.magnitude(cr, cb)
+        d -= self.tol
+        d *= 255 / self.soft
+        np.clip(d, 0, 255, out=d)
+        return d.astype(np.uint8)
+
+    def despill(self, frame):
+        """Pulls the screen channel down towards the max of the other two (in place)."""
+        if self.spill <= 0: return frame
+        c = frame[:,:,self.ch]
+        o = [frame[:,:,i] for i in range(3) if i != self.ch]
+        limit = np.maximum(o[0], o[1])
+        np.minimum(c, limit, out=limit)
+        if self.spill < 1: limit = cv2.addWeighted(np.ascontiguousarray(c), 1 - self.spill, limit, self.spill, 0)
+        np.copyto(c, limit)
+        return frame
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import subprocess
+import numpy as np
+from src.core.decoder import FFmpegReader, probe
+
+SIDE_DIR = os.path.join("temp", "masks") # App cache, never the user's media folder
+SIDE_BUDGET_MB = int(os.environ.get("NAIWEB_MASK_CACHE_MB", 4096)) # Least recently used sidecars go past this; 0 disables the cache
+
+def source_hash(path, block=4 << 20):
+    """
+    Fast content key: file size plus the first and last 4 MB.
+    Hashing a whole multi-GB video would cost more than the re-export it saves.
+    """
+    h = hashlib.sha1()
+    size = os.path.getsize(path)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(block))
+        if size > block:
+            f.seek(max(block, size - block))
+            h.update(f.read(block))
+    return h.hexdigest()
+
+def sidecar_path(in_path, **settings):
+    """Sidecar in the app cache, keyed by source hash + every setting that shapes the raw mask (None when disabled)."""
+    if SIDE_BUDGET_MB <= 0: return None
+    key = hashlib.sha1((source_hash(in_path) + repr(sorted(settings.items()))).encode()).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(in_path))[0]
+    os.makedirs(SIDE_DIR, exist_ok=True)
+    return os.path.join(SIDE_DIR, f"{base}.{key}.mask.mkv")
+
+def open_sidecar(path, start=0, end=None):
+    os.utime(path) # Recently replayed = evicted last
+    return FFmpegReader(path, start, end, pix_fmt="gray", info=probe(path))
+
+def _sidecars():
+    if not os.path.isdir(SIDE_DIR): return []
+    return [e for e in os.scandir(SIDE_DIR) if e.name.endswith(".mask.mkv")]
+
+def evict(budget_mb=SIDE_BUDGET_MB, keep=None):
+    """Deletes the least recently used sidecars until the cache fits in `budget_mb` (`keep` is spared)."""
+    files = sorted(_sidecars(), key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in files)
+    for e in files:
+        if total <= budget_mb << 20: break
+        if keep and os.path.abspath(e.path) == os.path.abspath(keep): continue
+        total -= e.stat().st_size
+        try: os.remove(e.path)
+        except OSError: pass
+
+def clear_sidecars():
+    """Empties the mask cache; returns the bytes freed."""
+    freed = 0
+    for e in _sidecars():
+        try: size = e.stat().st_size; os.remove(e.path); freed += size
+        except OSError: pass
+    return freed
+
+def join_sidecar(parts, path):
+    """Concatenates per-chunk mask segments (stream copy) and publishes them as one sidecar."""
+    lst = path + ".txt"
+    with open(lst, "w") as f:
+        for p in parts: f.write("file '{}'\n".format(os.path.abspath(p).replace("'", "'\\''")))
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", lst, "-c", "copy", "-f", "matroska", path + ".part"]
+    ok = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    os.remove(lst)
+    if ok:
+        os.replace(path + ".part", path)
+        evict(keep=path)
+    elif os.path.exists(path + ".part"): os.remove(path + ".part")
+    return ok
+
+class MaskWriter:
+    """Lossless grayscale FFV1 stream of per-frame raw masks, published only once complete."""
+    def __init__(self, path, w, h, fps, cache=True):
+        self.path = path
+        self.cache = cache # False for chunk segments outside the cache (nothing to evict)
+        self.tmp = path + ".part"
+        cmd = ["ffmpeg", "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{w}x{h}", "-r", str(fps), "-i", "-",
+               "-c:v", "ffv1", "-level", "3", "-slices", "4", "-f", "matroska", self.tmp]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def write(self, mask):
+        self.proc.stdin.write(memoryview(np.ascontiguousarray(mask)))
+
+    def close(self, keep=True):
+        self.proc.stdin.close()
+        ok = self.proc.wait() == 0
+        if keep and ok:
+            os.replace(self.tmp, self.path)
+            if self.cache: evict(keep=self.path)
+        elif os.path.exists(self.tmp): os.remove(self.tmp)
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+
+def guided_coeffs(I, p, radius, eps):
+    """Linear coefficients (a, b) of the guided filter (He et al.), box filters only."""
+    k = (2*radius + 1, 2*radius + 1)
+    mean_I = cv2.boxFilter(I, -1, k)
+    mean_p = cv2.boxFilter(p, -1, k)
+    cov_Ip = cv2.boxFilter(I * p, -1, k) - mean_I * mean_p
+    var_I = cv2.boxFilter(I * I, -1, k) - mean_I * mean_I
+    a = cov_Ip / (var_I + eps)
+    b = mean_p - a * mean_I
+    return cv2.boxFilter(a, -1, k), cv2.boxFilter(b, -1, k)
+
+def guided_filter(guide, mask, radius=8, eps=1e-4):
+    """Edge-aware smoothing of a uint8 mask following a gray uint8 guide of the same size."""
+    I = guide.astype(np.float32) / 255
+    a, b = guided_coeffs(I, mask.astype(np.float32) / 255, radius, eps)
+    return _to_u8(a * I + b)
+
+def upsample_mask(mask, frame, radius=4, eps=1e-4):
+    """
+    Brings a low-res mask back to the frame's resolution (fast guided filter).
+    Coefficients are solved at mask resolution and applied to the full-res guide,
+    so edges snap to the real image instead of the blurry upscaled mask.
+    """
+    h, w = frame.shape[:2]
+    if mask.shape[:2] == (h, w): return mask
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    I = gray.astype(np.float32) / 255
+    I_lo = cv2.resize(I, (mask.shape[1], mask.shape[0]), interpolation=cv2.INTER_AREA)
+    a, b = guided_coeffs(I_lo, mask.astype(np.float32) / 255, radius, eps)
+    a = cv2.resize(a, (w, h), interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(b, (w, h), interpolation=cv2.INTER_LINEAR)
+    np.multiply(a, I, out=a)
+    a += b
+    return _to_u8(a)
+
+def downscale(frame, scale):
+    if scale >= 1: return frame
+    h, w = frame.shape[:2]
+    return cv2.resize(frame, (max(1, int(w*scale)), max(1, int(h*scale))), interpolation=cv2.INTER_AREA)
+
+def _to_u8(x):
+    np.multiply(x, 255, out=x)
+    np.clip(x, 0, 255, out=x)
+    return x.astype(np.uint8)
+
+def band_matte(frame, mask, band=10, radius=6, eps=1e-4):
+    """
+    Fast matting: a trimap is built from the raw mask and alpha is only refined
+    inside the uncertain band around the edge (guided filter, frame as guide).
+    Everywhere else the mask is snapped to 0/255, and the filter only runs on
+    the band's bounding box instead of the whole frame.
+    """
+    _, hard = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    k = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*band + 1, 2*band + 1))
+    unknown = cv2.morphologyEx(hard, cv2.MORPH_GRADIENT, k)
+    pts = cv2.findNonZero(unknown)
+    if pts is None: return hard
+
+    # Solve only on the band's bounding box (padded by the filter radius)
+    h, w = mask.shape[:2]
+    x, y, bw, bh = cv2.boundingRect(pts)
+    x0, y0 = max(0, x - radius), max(0, y - radius)
+    x1, y1 = min(w, x + bw + radius), min(h, y + bh + radius)
+    guide = frame[y0:y1, x0:x1]
+    gray = cv2.cvtColor(guide, cv2.COLOR_BGR2GRAY) if guide.ndim == 3 else guide
+    refined = guided_filter(gray, mask[y0:y1, x0:x1], radius, eps)
+
+    roi = hard[y0:y1, x0:x1]
+    np.copyto(roi, refined, where=unknown[y0:y1, x0:x1] > 0)
+    return hard
+
+class TemporalSmoother:
+    """
+    Motion-guided EMA over raw masks. Where the frame is static the mask is averaged over
+    time (flicker dies out), where it moves the new mask wins right away (no ghost trails).
+    Motion comes from the low-res gray frames the engine already computes; all state
+    buffers are allocated once.
+    """
+    def __init__(self, w, h, strength=0.6, motion_gain=12.0):
+        self.strength, self.gain = strength, motion_gain
+        self.acc = np.zeros((h, w), np.float32)
+        self.cur = np.empty((h, w), np.float32)
+        self.weight = np.empty((h, w), np.float32)
+        self.out = np.empty((h, w), np.uint8)
+        self.prev = None
+
+    def __call__(self, mask, small):
+        np.copyto(self.cur, mask, casting="unsafe")
+        if self.prev is None: np.copyto(self.acc, self.cur)
+        else:
+            # Per-pixel blend weight: 1 - strength on static pixels, up to 1 where the frame changed
+            motion = cv2.absdiff(small, self.prev).astype(np.float32)
+            cv2.resize(motion, self.weight.shape[::-1], dst=self.weight, interpolation=cv2.INTER_LINEAR)
+            self.weight *= self.gain / 255
+            np.clip(self.weight, 0, 1, out=self.weight)
+            self.weight *= self.strength
+            self.weight += 1 - self.strength
+            self.cur -= self.acc
+            self.cur *= self.weight
+            self.acc += self.cur
+        self.prev = small
+        return cv2.convertScaleAbs(self.acc, dst=self.out)
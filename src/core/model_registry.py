@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import onnxruntime as ort
+    from rembg import new_session
+    from rembg.sessions import sessions_class
+    REMBG_AVAIL = True
+except: REMBG_AVAIL = False
+
+OPT_LEVELS = ("none", "basic", "extended", "all") # ONNX Runtime graph optimization levels
+DEFAULT_MB = 350 # Resident estimate when the .onnx file is not on disk yet
+
+class ModelRegistry:
+    """
+    Process-wide cache of rembg sessions shared by every engine (VideoEngine, ImageEngine...).
+    Sessions are keyed by model name and evicted least-recently-used once the estimated
+    resident memory goes over `budget_mb`. A session handed out stays valid for whoever
+    holds it, eviction only drops the registry's reference.
+    """
+    def __init__(self, budget_mb=1536, intra_threads=0, inter_threads=0, opt_level="all"):
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict() # (name, intra threads) -> (session, estimated MB)
+        self.budget_mb = budget_mb
+        self.intra_threads = intra_threads # 0 = let ONNX Runtime decide
+        self.inter_threads = inter_threads
+        self.opt_level = opt_level
+
+    def configure(self, budget_mb=None, intra_threads=None, inter_threads=None, opt_level=None):
+        """Changes runtime settings. Thread or optimization changes drop cached sessions (they are baked in at load)."""
+        with self.lock:
+            reload = ((intra_threads is not None and intra_threads != self.intra_threads) or
+                      (inter_threads is not None and inter_threads != self.inter_threads) or
+                      (opt_level is not None and opt_level != self.opt_level))
+            if budget_mb is not None: self.budget_mb = budget_mb
+            if intra_threads is not None: self.intra_threads = intra_threads
+            if inter_threads is not None: self.inter_threads = inter_threads
+            if opt_level is not None: self.opt_level = opt_level
+            if reload: self.sessions.clear()
+            self._evict()
+
+    def get(self, name, stat=None, workers=1):
+        """
+        Returns the shared session for `name`, loading it on first use.
+        `workers` threads calling it at once split the cores between them instead of each claiming all of them.
+        """
+        if not REMBG_AVAIL: return None
+        threads = self.intra_threads
+        if workers > 1: threads = min(threads or os.cpu_count() or 1, max(1, (os.cpu_count() or 1) // workers))
+        key = (name, threads)
+        with self.lock:
+            if key in self.sessions:
+                self.sessions.move_to_end(key)
+                return self.sessions[key][0]
+
+            if stat: stat(f"Cargando Modelo AI {name}...")
+            sess = self._load(name, threads)
+            self.sessions[key] = (sess, self._size_mb(name))
+            self._evict(keep=key)
+            return sess
+
+    def loaded(self):
+        with self.lock: return list(dict.fromkeys(name for name, _ in self.sessions))
+
+    def downloaded(self, name):
+        """True when the model's weights are already on disk (loading it will not hit the network)."""
+        return REMBG_AVAIL and self._path(name) is not None
+
+    def _load(self, name, threads=0):
+        opts = ort.SessionOptions()
+        if threads: opts.intra_op_num_threads = threads
+        if self.inter_threads:
+            opts.inter_op_num_threads = self.inter_threads
+            opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        opts.graph_optimization_level = {
+            "none": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        }.get(self.opt_level, ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+
+        # Build the session class directly so our SessionOptions are used (new_session only reads OMP_NUM_THREADS)
+        for sc in sessions_class:
+            if sc.name() == name: return sc(name, opts)
+        return new_session(name)
+
+    def _path(self, name):
+        for sc in sessions_class:
+            if sc.name() == name:
+                path = os.path.join(sc.u2net_home(), f"{name}.onnx")
+                return path if os.path.exists(path) else None
+        return None
+
+    def _size_mb(self, name):
+        # ONNX Runtime keeps roughly twice the weights resident (weights + optimized graph)
+        path = self._path(name)
+        return 2 * os.path.getsize(path) / (1 << 20) if path else DEFAULT_MB
+
+    def _evict(self, keep=None):
+        while len(self.sessions) > 1 and sum(mb for _, mb in self.sessions.values()) > self.budget_mb:
+            oldest = next(iter(self.sessions))
+            if oldest == keep: break
+            self.sessions.popitem(last=False)
+
+# Shared instance used by all engines
+REGISTRY = ModelRegistry(budget_mb=int(os.environ.get("NAIWEB_MODEL_BUDGET_MB", 1536)),
+                         intra_threads=int(os.environ.get("NAIWEB_ORT_INTRA", 0)),
+                         inter_threads=int(os.environ.get("NAIWEB_ORT_INTER", 0)),
+                         opt_level=os.environ.get("NAIWEB_ORT_OPT", "all"))
@@ -1,137 +1,514 @@
 import cv2
 import sys
 import argparse
-import gc
+import bisect
+import hashlib
+import json
+import multiprocessing
 import os
-import subprocess
+import queue
+import shutil
+import tempfile
 import time
+import numpy as np
+import subprocess
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
 
-def process_video(input_path, mask_path, output_path, is_mov):
-    if not os.path.exists(input_path):
-        print(f"Error: Input file not found: {input_path}", file=sys.stderr)
-        sys.exit(1)
-    if not os.path.exists(mask_path):
-        print(f"Error: Mask file not found: {mask_path}", file=sys.stderr)
-        sys.exit(1)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from src.core.decoder import open_video, probe, keyframes, FFmpegReader, DECODER
+from src.core.temporal_fill import TemporalFill, REACH, MOTION_PAD
 
-    temp_video = output_path + "_temp.mp4"
+RADIUS = 3 # cv2.inpaint neighbourhood
+# Inpainting tiers: diffusion only, or a motion-aligned background plate with diffusion for what it can't see
+ALGOS = {"telea": cv2.INPAINT_TELEA, "ns": cv2.INPAINT_NS, "temporal": cv2.INPAINT_TELEA}
+X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+                 "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444"} # ffprobe name -> x264
+SEGMENT_FMT = ("mpegts", "ts") # Smart-render intermediates: Annex-B keeps SPS/PPS in-band, so copied and re-encoded parts can be joined
 
-    try:
-        # Load Mask
-        mask_img = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-        if mask_img is None:
-            print("Error: Could not load mask image.", file=sys.stderr)
-            sys.exit(1)
+def mask_rois(mask, pad):
+    """
+    Bounding boxes (x0, y0, x1, y1) of the mask's connected components, padded by `pad`
+    so inpainting a crop sees every pixel it would see on the full frame.
+    Boxes that overlap after padding are merged.
+    """
+    h, w = mask.shape
+    n, _, stats, _ = cv2.connectedComponentsWithStats((mask > 0).astype(np.uint8), connectivity=8)
+    boxes = [[max(0, x - pad), max(0, y - pad), min(w, x + bw + pad), min(h, y + bh + pad)] for x, y, bw, bh, _ in stats[1:n].tolist()]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]; merged = True; break
+            if merged: break
+    return [tuple(b) for b in boxes]
 
-        cap = cv2.VideoCapture(input_path)
-        if not cap.isOpened():
-            print("Error: Could not open video.", file=sys.stderr)
-            sys.exit(1)
+class PatchCache:
+    """
+    Inpainted patches keyed by a hash of the source pixels under each padded ROI.
+    Screen recordings repeat the same pixels for thousands of frames: a hit copies the
+    stored patch instead of running cv2.inpaint again (same input, same output).
+    Bounded by `budget_mb` (least recently used patches go first); footage that shows no
+    repeats within the first PROBE misses stops being stored at all.
+    """
+    PROBE = 120
 
-        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    def __init__(self, budget_mb=256):
+        self.budget_mb = budget_mb
+        self.budget = int(budget_mb * (1 << 20))
+        self.used = 0
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.spent = 0.0 # Seconds spent inpainting on misses
 
-        # Resolution Warning
-        if w > 1920 or h > 1080:
-             print(f"Warning: High resolution video ({w}x{h}). Memory usage may be high.")
+    def key(self, i, src):
+        return i, hashlib.blake2b(src, digest_size=16).digest()
+
+    def get(self, key):
+        patch = self.entries.get(key)
+        if patch is None: self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return patch
 
-        # Resize mask if needed
-        if mask_img.shape[:2] != (h, w):
-            print(f"Resizing mask from {mask_img.shape[:2]} to {(h, w)}")
-            mask_img = cv2.resize(mask_img, (w, h), interpolation=cv2.INTER_NEAREST)
+    def put(self, key, patch, secs):
+        self.spent += secs
+        if self.budget <= 0 or patch.nbytes > self.budget: return
+        if not self.hits and self.misses >= self.PROBE: # Nothing repeats: stop paying for copies
+            self.budget = self.used = 0
+            self.entries.clear()
+            return
+        self.entries[key] = patch.copy()
+        self.used += patch.nbytes
+        while self.used > self.budget: self.used -= self.entries.popitem(last=False)[1].nbytes
 
-        # Output Setup - ALWAYS use mp4v for temp to avoid OOM
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(temp_video, fourcc, fps, (w, h))
+    def report(self):
+        # Hit rate and time saved, estimated from the mean cost of a miss
+        total = self.hits + self.misses
+        saved = self.hits * self.spent / self.misses if self.misses else 0.0
+        return f"cache={self.hits / total if total else 0:.1%} saved={saved:.1f}s"
 
-        if not writer.isOpened():
-             print("Error: Could not open video writer.", file=sys.stderr)
-             sys.exit(1)
+def open_encoder(input_path, output_path, w, h, fps, is_mov, log_file, overlay=None):
+    """
+    Single-pass encoder: raw BGR frames on stdin plus the source file as a second
+    input, so its audio is mapped straight in (optional: '1:a:0?') and the output
+    is finished as soon as the pipe closes.
+    With `overlay` = (x, y), stdin carries only BGRA patches of w x h that ffmpeg lays
+    over the decoded source at that position (untouched pixels never reach Python).
+    Both streams are retimed to frame index / fps, so on variable frame rate sources patch N
+    still lands on source frame N (the output is constant rate, same as the full-frame path).
+    """
+    cmd = [
+        "ffmpeg", "-y", "-f", "rawvideo", "-pix_fmt", "bgra" if overlay else "bgr24", "-s", f"{w}x{h}", "-r", str(fps), "-i", "-",
+        "-i", input_path,
+    ]
+    if overlay:
+        ts = f"setpts=N/({fps}*TB)"
+        cmd += ["-filter_complex", f"[1:v:0]{ts}[bg];[0:v]{ts}[fg];"
+                                   "[bg][fg]overlay={}:{}:eof_action=pass[v]".format(*overlay),
+                "-map", "[v]", "-map", "1:a:0?", "-r", str(fps)]
+    else:
+        cmd += ["-map", "0:v:0", "-map", "1:a:0?"]
+    cmd += ["-af", "apad", "-shortest", "-shortest_buf_duration", "0.5"] # The video sets the length: a shorter audio track must not stop stdin
+    if is_mov:
+        # Force pix_fmt for compatibility
+        cmd.extend(["-c:v", "prores", "-pix_fmt", "yuv422p10le", "-c:a", "pcm_s16le"])
+    else:
+        cmd.extend(["-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p", "-c:a", "aac"])
+    cmd.append(output_path)
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=log_file)
 
-        print(f"Starting processing: {total_frames} frames.")
-        
-        # Processing Loop with Retry Logic
-        cnt = 0
-        retry_count = 0
-        MAX_RETRIES = 5
-        
+def feed(writer, buf):
+    """Writes one frame; False once the encoder has exited cleanly (end of stream), raises if it failed."""
+    try: writer.stdin.write(buf)
+    except BrokenPipeError:
+        if writer.wait() != 0: raise
+        return False
+    return True
+
+def finish(writer):
+    try: writer.stdin.close()
+    except BrokenPipeError: pass # Already exited, wait() reports how
+    return writer.wait()
+
+def inpaint_rois(frame, rois, cache, tag=0, method=cv2.INPAINT_TELEA):
+    # Patches every ROI of `frame` in place, through the cache (`tag` keeps different masks apart)
+    for i, (x0, y0, x1, y1, m, src, dst) in enumerate(rois):
+        roi = frame[y0:y1, x0:x1]
+        np.copyto(src, roi) # Contiguous copy to hash
+        key = cache.key((tag, i), src)
+        patch = cache.get(key)
+        if patch is None:
+            t0 = time.perf_counter()
+            cv2.inpaint(src, m, RADIUS, method, dst=dst)
+            cache.put(key, dst, time.perf_counter() - t0)
+            patch = dst
+        roi[:] = patch
+
+def make_rois(mask, boxes, ox=0, oy=0):
+    # Crops of the mask, their sources and outputs are allocated once (in decoded-frame coordinates)
+    return [(x0 - ox, y0 - oy, x1 - ox, y1 - oy, np.ascontiguousarray(mask[y0:y1, x0:x1]),
+             np.empty((y1 - y0, x1 - x0, 3), np.uint8), np.empty((y1 - y0, x1 - x0, 3), np.uint8))
+            for x0, y0, x1, y1 in boxes]
+
+def _pool_worker(shm_name, n, shape, masks, boxes, ox, oy, cache_mb, method, tasks, results):
+    # Builds its ROIs from the interval masks once, then inpaints slots in place until told to stop
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((n, *shape), np.uint8, buffer=shm.buf)
+    plans = [make_rois(m, bx, ox, oy) if m is not None else [] for m, bx in zip(masks, boxes)]
+    cache = PatchCache(cache_mb)
+    try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
-                # If we are effectively at the end (within 5 frames), stop.
-                if total_frames > 0 and (total_frames - cnt) < 5:
-                    break
-                
-                # Otherwise, try to retry reading (sometimes CV2 hiccups)
-                retry_count += 1
-                if retry_count > MAX_RETRIES:
-                    print(f"Warning: Stopped reading at frame {cnt}/{total_frames}. Stream might be corrupted.")
-                    break
-                print(f"Warning: Frame read failed at {cnt}. Retrying ({retry_count})...")
-                time.sleep(0.1)
+            task = tasks.get()
+            if task is None: break
+            slot, k = task
+            hits, misses, spent = cache.hits, cache.misses, cache.spent
+            inpaint_rois(frames[slot], plans[k], cache, k, method)
+            results.put((slot, cache.hits - hits, cache.misses - misses, cache.spent - spent))
+    except Exception as e:
+        results.put((-1, str(e), 0, 0))
+    finally:
+        del frames
+        shm.close()
+
+class InpaintPool:
+    """
+    `workers` processes inpainting decoded frames in place. Frames travel through a ring of
+    shared-memory slots (only slot numbers go through the queues) and each process holds the
+    masks once. Frames come back in submission order, so the encoder sees the same stream as
+    the single-process loop. Every process has its own PatchCache with an equal share of
+    `cache_mb`; their stats are summed into the caller's cache for the progress report.
+    """
+    def __init__(self, workers, shape, masks, boxes, ox=0, oy=0, cache_mb=256, method=cv2.INPAINT_TELEA):
+        ctx = multiprocessing.get_context("spawn")
+        self.n = workers * 2 # One slot being inpainted and one queued per worker
+        self.shm = shared_memory.SharedMemory(create=True, size=self.n * int(np.prod(shape)))
+        self.frames = np.ndarray((self.n, *shape), np.uint8, buffer=self.shm.buf)
+        self.tasks, self.results = ctx.Queue(), ctx.Queue()
+        self.procs = [ctx.Process(target=_pool_worker, args=(self.shm.name, self.n, shape, masks, boxes, ox, oy, cache_mb / workers, method, self.tasks, self.results), daemon=True)
+                      for _ in range(workers)]
+        for p in self.procs: p.start()
+        self.free = deque(range(self.n))
+        self.pending = deque() # (slot, frame index, interval) in submission order
+        self.ready = set()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def full(self):
+        return not self.free
+
+    def buffer(self):
+        # Free slot to decode the next frame into
+        return self.frames[self.free[0]]
+
+    def submit(self, idx, k):
+        slot = self.free.popleft()
+        self.pending.append((slot, idx, k))
+        self.tasks.put((slot, k))
+
+    def pop(self, cache):
+        """Oldest submitted frame, once inpainted: (index, interval, frame). The frame stays valid until the next buffer() is filled."""
+        slot, idx, k = self.pending.popleft()
+        while slot not in self.ready:
+            try: done, hits, misses, spent = self.results.get(timeout=1)
+            except queue.Empty:
+                if not all(p.is_alive() for p in self.procs): raise RuntimeError("Inpainting worker died")
                 continue
-            
-            retry_count = 0 # Reset on success
-            cnt += 1
-            
-            # Inpaint
-            clean_frame = cv2.inpaint(frame, mask_img, 3, cv2.INPAINT_TELEA)
-            writer.write(clean_frame)
+            if done < 0: raise RuntimeError(f"Inpainting worker failed: {hits}")
+            self.ready.add(done)
+            cache.hits += hits; cache.misses += misses; cache.spent += spent
+        self.ready.discard(slot)
+        self.free.append(slot)
+        return idx, k, self.frames[slot]
+
+    def close(self):
+        for _ in self.procs: self.tasks.put(None)
+        for p in self.procs:
+            p.join(timeout=5)
+            if p.is_alive(): p.terminate()
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
+
+def inpainted(cap, bounds, plans, cache, pool=None, first=0, method=cv2.INPAINT_TELEA, fill=None):
+    """
+    Decodes and inpaints frames in order, yielding (index, interval, frame). `bounds` are the
+    interval starts; frame buffers are reused, so each frame is only valid until the next step.
+    With a pool, decoding runs ahead while the workers inpaint (up to one slot per free buffer).
+    With a TemporalFill, frames go through its plate instead (sequential, no cache).
+    """
+    if fill is not None:
+        yield from fill.frames(cap, bounds, first)
+        return
+    frame = None
+    idx = first
+    while True:
+        if pool is not None and pool.full(): yield pool.pop(cache)
+        buf = frame if pool is None else pool.buffer()
+        ret, f = cap.read(buf)
+        if not ret: break
+        k = bisect.bisect_right(bounds, idx) - 1
+        if pool is None:
+            frame = f
+            inpaint_rois(frame, plans[k], cache, k, method)
+            yield idx, k, frame
+        else:
+            if f is not buf: np.copyto(buf, f) # OpenCV may hand back its own buffer
+            pool.submit(idx, k)
+        idx += 1
+    while pool is not None and len(pool): yield pool.pop(cache)
+
+def load_mask(path, w, h):
+    mask_img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if mask_img is not None and mask_img.shape[:2] != (h, w):
+        print(f"Resizing mask from {mask_img.shape[:2]} to {(h, w)}")
+        mask_img = cv2.resize(mask_img, (w, h), interpolation=cv2.INTER_NEAREST)
+    return mask_img
+
+def load_ranges(path, w, h):
+    """
+    Time-ranged masks: JSON list of {"start": frame, "end": frame or null, "mask": png path}
+    (end exclusive, null = until the end of the video). Returns [(start, end, mask)].
+    """
+    with open(path, "r") as f: items = json.load(f)
+    ranges = []
+    for it in items:
+        m = load_mask(it["mask"], w, h)
+        if m is None: raise ValueError(f"Could not load mask image {it['mask']}")
+        ranges.append((int(it.get("start") or 0), it.get("end"), m))
+    return ranges
+
+def plan_intervals(ranges, total):
+    """Splits [0, total) wherever the set of active masks changes: [(start, end, union mask or None)]."""
+    stop = lambda e: total if e is None else max(0, min(int(e), total))
+    cuts = sorted({0, total} | {max(0, min(s, total)) for s, _, _ in ranges} | {stop(e) for _, e, _ in ranges})
+    intervals = []
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        mask = None
+        for s, e, m in ranges:
+            if s <= a and b <= stop(e): mask = m.copy() if mask is None else cv2.bitwise_or(mask, m, dst=mask)
+        intervals.append((a, b, mask))
+    return intervals
+
+def render_frames(cap, input_path, output_path, intervals, is_mov, cache, patch, log_file, workers=1, algo="telea"):
+    """Decodes every frame, inpaints the masks active at that frame and encodes. Returns ffmpeg's exit code."""
+    w, h, fps, total_frames = cap.w, cap.h, cap.fps, cap.frames
+    
+    # Inpaint only the padded mask components
+    boxes = [mask_rois(m, RADIUS + 1) if m is not None else [] for _, _, m in intervals]
+    area = max(sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in b) for b in boxes)
+    flat = [bx for b in boxes for bx in b]
+    
+    # Patch mode: decode only the union of the regions (plus a margin so chroma upsampling at the
+    # crop edge matches a full decode, and room for the plate to follow the motion) and let ffmpeg
+    # composite the patches over the source
+    ox = oy = 0; pw, ph = w, h
+    patch = patch and flat and isinstance(cap, FFmpegReader)
+    if patch:
+        pad = 8 + (REACH + MOTION_PAD if algo == "temporal" else 0)
+        ox = max(0, min(b[0] for b in flat) - pad); oy = max(0, min(b[1] for b in flat) - pad)
+        pw = min(w, max(b[2] for b in flat) + pad) - ox; ph = min(h, max(b[3] for b in flat) + pad) - oy
+        cap.release()
+        cap = FFmpegReader(input_path, crop=(ox, oy, pw, ph))
+        bgra = np.empty((ph, pw, 4), np.uint8)
+    
+    # Per interval: its ROIs (pool workers build their own) and (patch mode) the alpha that makes only its masked pixels opaque
+    masks = [m for _, _, m in intervals]
+    method = ALGOS[algo]
+    fill = TemporalFill([m if m is None else m[oy:oy + ph, ox:ox + pw] for m in masks],
+                        [[(x0 - ox, y0 - oy, x1 - ox, y1 - oy) for x0, y0, x1, y1 in bx] for bx in boxes],
+                        (ph, pw), RADIUS, method) if algo == "temporal" and flat else None
+    rois = [make_rois(m, bx, ox, oy) if m is not None and workers <= 1 and fill is None else [] for m, bx in zip(masks, boxes)]
+    report = (fill or cache).report
+    alphas = [np.where(m[oy:oy + ph, ox:ox + pw] > 0, 255, 0).astype(np.uint8) if patch and m is not None else None for m in masks]
+    if patch: blank = np.zeros((ph, pw), np.uint8)
+    
+    # Output Setup - frames go straight to the final encoder (no temp file, no second pass)
+    if patch: writer = open_encoder(input_path, output_path, pw, ph, fps, is_mov, log_file, overlay=(ox, oy))
+    else: writer = open_encoder(input_path, output_path, w, h, fps, is_mov, log_file)
+    mode = f", patch {pw}x{ph}" if patch else ""
+    ranged = f", {len(intervals)} time ranges" if len(intervals) > 1 else ""
+    pooled = f", {workers} workers" if workers > 1 else ""
+    print(f"Starting processing: {total_frames} frames, {len(flat)} regions ({area / (w * h):.1%} of the frame{mode}{ranged}{pooled}, {algo}).")
+    
+    # Processing Loop (decoder buffers are reused for every frame and patched in place)
+    pool = InpaintPool(workers, (ph, pw, 3), masks, boxes, ox, oy, cache.budget_mb, method) if workers > 1 else None
+    cnt = 0
+    try:
+        for idx, k, frame in inpainted(cap, [a for a, _, _ in intervals], rois, cache, pool, method=method, fill=fill):
+            cnt = idx + 1
+            if patch: # Only the masked pixels are opaque
+                cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=bgra)
+                bgra[:,:,3] = alphas[k] if alphas[k] is not None else blank
+                if not feed(writer, memoryview(bgra)): break
+            elif not feed(writer, memoryview(frame)): break
 
             # Progress update
             if total_frames > 0 and cnt % 10 == 0:
-                progress = (cnt / total_frames) * 0.9 
-                print(f"PROGRESS:{progress:.4f}")
+                progress = (cnt / total_frames) * 0.98
+                print(f"PROGRESS:{progress:.4f} {report()}")
                 sys.stdout.flush()
+    finally:
+        if pool is not None: pool.close()
+    if total_frames > 0 and cnt < total_frames:
+        print(f"Warning: Stopped reading at frame {cnt}/{total_frames}. Stream might be corrupted.")
 
-            # Aggressive GC
-            if cnt % 30 == 0:
-                gc.collect()
+    cap.release()
+    
+    print(f"Finalizing encode... ({report()})")
+    sys.stdout.flush()
+    return finish(writer)
 
-        cap.release()
-        writer.release()
+def smart_render(input_path, output_path, intervals, info, cache, log_file, workers=1, algo="telea"):
+    """
+    Re-encodes only the GOPs that touch a masked interval, the rest is stream-copied.
+    The source is cut at GOP-run boundaries by the segment muxer (no decoding), dirty runs
+    are swapped for re-encoded segments and everything is joined by the concat demuxer in
+    the same pass that maps the audio. Re-encoded runs use the source's pixel format,
+    profile and level so the joined stream stays uniform. Returns False when the source does
+    not allow it (keyframes unknown, not H.264, a profile x264 can't reproduce, cuts not
+    landing on keyframes) or a step fails: the caller then processes every frame.
+    """
+    total, fps, w, h = info["frames"], info["fps"], info["w"], info["h"]
+    kf = [k for k in keyframes(input_path) if k < total]
+    profile = X264_PROFILES.get(info.get("profile"))
+    if not kf or info.get("codec") != "h264" or not profile or not info.get("pix_fmt"): return False
+    x264 = ["-c:v", "libx264", "-preset", "medium", "-pix_fmt", info["pix_fmt"], "-profile:v", profile]
+    if info.get("level", 0) > 0: x264 += ["-level", f"{info['level'] / 10:g}"]
+    
+    # GOPs -> runs of consecutive GOPs that are all clean or all dirty (frames before the first keyframe can't be copied)
+    starts = sorted({0} | set(kf))
+    runs = []
+    for gs, ge in zip(starts, starts[1:] + [total]):
+        dirty = gs < kf[0] or any(m is not None and a < ge and gs < b for a, b, m in intervals)
+        if runs and runs[-1][2] == dirty: runs[-1][1] = ge
+        else: runs.append([gs, ge, dirty])
+    work = sum(e - s for s, e, d in runs if d)
+    print(f"Smart render: {work}/{total} frames re-encoded, {len(runs)} segments.")
+    sys.stdout.flush()
+    
+    tmp = tempfile.mkdtemp(prefix="smart_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        # 1. Cut the source at the run boundaries (all keyframes, so stream copy is exact)
+        cmd = ["ffmpeg", "-y", "-v", "error", "-i", input_path, "-map", "0:v:0", "-c:v", "copy",
+               "-f", "segment", "-segment_format", SEGMENT_FMT[0], "-reset_timestamps", "1"]
+        if len(runs) > 1: cmd += ["-segment_frames", ",".join(str(s) for s, _, _ in runs[1:])]
+        cmd.append(os.path.join(tmp, "copy_%04d." + SEGMENT_FMT[1]))
+        if subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=log_file).returncode != 0: return False
+        segs = [os.path.join(tmp, f"copy_{i:04d}.{SEGMENT_FMT[1]}") for i in range(len(runs))]
+        if len([f for f in os.listdir(tmp) if f.startswith("copy_")]) != len(runs): return False
         
-        del mask_img
-        del frame
-        del clean_frame
-        gc.collect()
+        # 2. Re-encode the dirty runs (same codec, pixel format, profile and level as the copied ones)
+        bounds = [a for a, _, _ in intervals]
+        masks = [m for _, _, m in intervals]
+        boxes = [mask_rois(m, RADIUS + 1) if m is not None else [] for m in masks]
+        method = ALGOS[algo]
+        if workers > 1:
+            pool, plans = InpaintPool(workers, (h, w, 3), masks, boxes, cache_mb=cache.budget_mb, method=method), None
+        else:
+            pool, plans = None, [make_rois(m, bx) if m is not None and algo != "temporal" else [] for m, bx in zip(masks, boxes)]
+        stats = cache
+        done = 0
+        try:
+            for i, (s, e, dirty) in enumerate(runs):
+                if not dirty: continue
+                segs[i] = os.path.join(tmp, f"enc_{i:04d}.{SEGMENT_FMT[1]}")
+                enc = subprocess.Popen(["ffmpeg", "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", str(fps), "-i", "-",
+                                        *x264, "-f", SEGMENT_FMT[0], segs[i]],
+                                       stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=log_file)
+                cap = FFmpegReader(input_path, s, e, info=info)
+                # The plate starts over on every run (the frames in between are not decoded)
+                fill = TemporalFill(masks, boxes, (h, w), RADIUS, method) if algo == "temporal" else None
+                stats = fill or cache
+                try:
+                    for _, _, frame in inpainted(cap, bounds, plans, cache, pool, first=s, method=method, fill=fill):
+                        enc.stdin.write(memoryview(frame))
+                        done += 1
+                        if done % 10 == 0:
+                            print(f"PROGRESS:{done / max(work, 1) * 0.98:.4f} {stats.report()}")
+                            sys.stdout.flush()
+                    enc.stdin.close()
+                except BrokenPipeError: pass # The encoder gave up (e.g. a format this libx264 lacks): its exit code says so
+                cap.release()
+                if enc.wait() != 0:
+                    print(f"Smart render: segment encode failed ({s}-{e}), re-encoding every frame.")
+                    return False
+        finally:
+            if pool is not None: pool.close()
         
-        print("PROGRESS:0.92")
-        print("Merging Audio (Final Step)...")
+        # 3. Join + audio from the source (no -shortest: a shorter audio track would cut the video)
+        print(f"Finalizing encode... ({stats.report()})")
         sys.stdout.flush()
+        list_path = os.path.join(tmp, "list.txt")
+        with open(list_path, "w") as f:
+            for p in segs: f.write("file '{}'\n".format(os.path.abspath(p).replace("'", "'\\''")))
+        cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-i", input_path,
+               "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", "-c:a", "aac", output_path]
+        if subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=log_file).returncode != 0:
+            print("Smart render: concat failed, re-encoding every frame.")
+            return False
+        return True
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
 
-        # FFmpeg Merge
-        c_v = "prores" if is_mov else "copy" # Changed from prores_ks to prores (standard)
-        c_a = "pcm_s16le" if is_mov else "aac"
-         
-        cmd = [
-            "ffmpeg", "-y", "-i", temp_video, "-i", input_path,
-            "-c:v", c_v, "-c:a", c_a, 
-            "-map", "0:v:0", "-map", "1:a:0?", "-shortest",
-            "-preset", "medium" # Relax preset
-        ]
-        # Removed profile:v 3 to allow standard profile (lighter)
-        if is_mov:
-             # Force pix_fmt for compatibility
-             cmd.extend(["-pix_fmt", "yuv422p10le"])
-            
-        cmd.append(output_path)
-        
-        log_path = output_path + ".log"
-        with open(log_path, "w") as log_file:
-            res = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=log_file)
+def process_video(input_path, mask_path, output_path, is_mov, decoder=DECODER, cache_mb=256, patch=False, ranges_path=None, workers=1, algo="telea"):
+    if not os.path.exists(input_path):
+        print(f"Error: Input file not found: {input_path}", file=sys.stderr)
+        sys.exit(1)
+    src_mask = ranges_path or mask_path
+    if not src_mask or not os.path.exists(src_mask):
+        print(f"Error: Mask file not found: {src_mask}", file=sys.stderr)
+        sys.exit(1)
+
+    log_path = output_path + ".log"
+
+    try:
+        cap = open_video(input_path, backend=decoder)
+        if not cap.isOpened():
+            print("Error: Could not open video.", file=sys.stderr)
+            sys.exit(1)
+
+        w, h = cap.w, cap.h
+
+        # Resolution Warning
+        if w > 1920 or h > 1080:
+             print(f"Warning: High resolution video ({w}x{h}). Memory usage may be high.")
+
+        # Load Masks (a plain mask covers the whole video)
+        if ranges_path: ranges = load_ranges(ranges_path, w, h)
+        else:
+            mask_img = load_mask(mask_path, w, h)
+            if mask_img is None:
+                print("Error: Could not load mask image.", file=sys.stderr)
+                sys.exit(1)
+            ranges = [(0, None, mask_img)]
+        intervals = plan_intervals(ranges, cap.frames or (1 << 31))
+        cache = PatchCache(cache_mb)
+        workers = workers or max(1, (os.cpu_count() or 2) - 2) # 0 = auto (the decoder and encoder keep a core each)
+        if algo == "temporal": workers = 1 # The plate carries state from frame to frame
+
+        log_file = open(log_path, "w")
+        # Smart render for ranged masks: untouched GOPs are stream-copied (MOV is always re-encoded to ProRes)
+        if ranges_path and not is_mov and smart_render(input_path, output_path, intervals, probe(input_path), cache, log_file, workers, algo):
+            cap.release()
+            res = 0
+        else:
+            res = render_frames(cap, input_path, output_path, intervals, is_mov, cache, patch, log_file, workers, algo)
+        log_file.close()
             
-        if res.returncode != 0:
-            print(f"Critical: FFmpeg Audio Merge Failed! Return Code: {res.returncode}", file=sys.stderr)
+        if res != 0:
+            print(f"Critical: FFmpeg Encode Failed! Return Code: {res}", file=sys.stderr)
             print(f"Check log file for details: {log_path}", file=sys.stderr)
-            # DO NOT RENAME TEMP FILE. 
             # We want the process to error out so the UI shows "Error" instead of "Done" with a broken file.
             sys.exit(1)
         else:
             # Success
-            if os.path.exists(temp_video): os.remove(temp_video)
             if os.path.exists(log_path): os.remove(log_path) 
             print("PROGRESS:1.0")
             print("Done.")
@@ -139,16 +516,20 @@ def process_video(input_path, mask_path, output_path, is_mov):
     except Exception as e:
         print(f"Critical Error: {e}", file=sys.stderr)
         sys.exit(1)
-    finally:
-        gc.collect()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Watermark Remover Worker Process")
     parser.add_argument("--input", required=True, help="Input video path")
-    parser.add_argument("--mask", required=True, help="Mask image path")
+    parser.add_argument("--mask", help="Mask image path (whole video)")
+    parser.add_argument("--ranges", help="JSON list of time-ranged masks (smart render: untouched GOPs are stream-copied)")
     parser.add_argument("--output", required=True, help="Output video path")
     parser.add_argument("--mov", action="store_true", help="Export as MOV")
+    parser.add_argument("--decoder", default=DECODER, choices=["ffmpeg", "opencv"], help="Frame decoder backend")
+    parser.add_argument("--cache", type=int, default=256, help="MB of inpainted patches kept for repeated frames, shared by the workers (0 = off)")
+    parser.add_argument("--patch", action="store_true", help="Decode/encode only the masked region, ffmpeg overlays it on the source")
+    parser.add_argument("--workers", type=int, default=1, help="Inpainting processes fed through shared memory (0 = auto)")
+    parser.add_argument("--algo", default="telea", choices=list(ALGOS), help="Inpainting: diffusion (telea/ns) or temporal background plate for moving shots")
     
     args = parser.parse_args()
     
-    process_video(args.input, args.mask, args.output, args.mov)
+    process_video(args.input, args.mask, args.output, args.mov, args.decoder, args.cache, args.patch, args.ranges, args.workers, args.algo)
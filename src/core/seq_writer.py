@@ -0,0 +1,48 @@
+import cv2
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Output format -> image extension for frame sequences
+SEQ_FORMATS = {"png_seq": "png", "tiff_seq": "tiff", "qoi_seq": "qoi"}
+
+def qoi_available():
+    # QOI needs OpenCV >= 4.9 built with the codec
+    return cv2.haveImageWriter("frame.qoi")
+
+class SequenceWriter:
+    """
+    Writes numbered frames through a thread pool (cv2.imwrite releases the GIL, so
+    zlib runs on every core). Writes complete in submission order: at most
+    `threads * 2` frames are in flight and the oldest is awaited first, which
+    bounds memory and surfaces write errors on the frame that caused them.
+    """
+    def __init__(self, seq_dir, fmt="png_seq", png_level=1, threads=0):
+        ext = SEQ_FORMATS.get(fmt, "png")
+        if ext == "qoi" and not qoi_available(): ext = "tiff" # Next fastest lossless option
+        self.pattern = os.path.join(seq_dir, "frame_{:05d}." + ext)
+
+        if ext == "png": self.params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_level)]
+        elif ext == "tiff": self.params = [cv2.IMWRITE_TIFF_COMPRESSION, 1] # 1 = uncompressed
+        else: self.params = []
+
+        threads = threads or os.cpu_count() or 2
+        self.pool = ThreadPoolExecutor(threads)
+        self.inflight = deque()
+        self.limit = threads * 2
+
+    def write(self, img, cnt):
+        # Copy: callers hand in reusable compositor buffers
+        self.inflight.append(self.pool.submit(self._save, self.pattern.format(cnt), img.copy()))
+        while len(self.inflight) > self.limit:
+            self.inflight.popleft().result()
+
+    def close(self):
+        try:
+            while self.inflight: self.inflight.popleft().result()
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _save(self, path, img):
+        if not cv2.imwrite(path, img, self.params):
+            raise IOError(f"No se pudo escribir {path}")
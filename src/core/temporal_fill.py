@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+from collections import deque
+
+REACH = 64 # Largest motion between two frames the plate follows (px)
+LOOKAHEAD = 6 # Frames read ahead to fill what only shows up later (start of a pan)
+MOTION_PAD = 3 * REACH # Background around the masks used for the motion estimate
+MOTION_W = 1024 # Wider motion crops are downscaled (it costs sub-pixel accuracy, and the plate accumulates it)
+MIN_RESPONSE = 0.05 # Phase correlation peak below this = scene cut, the plate is dropped
+SNAP = 0.1 # Sub-pixel residuals below this are estimation noise, not motion (keeps integer pans from drifting)
+
+def _window(img, x0, y0, x1, y1, fill=0):
+    # img[y0:y1, x0:x1], padded with `fill` where the window leaves the image
+    h, w = img.shape[:2]
+    out = np.full((y1 - y0, x1 - x0) + img.shape[2:], fill, img.dtype)
+    ax0, ay0, ax1, ay1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+    if ax0 < ax1 and ay0 < ay1: out[ay0 - y0:ay1 - y0, ax0 - x0:ax1 - x0] = img[ay0:ay1, ax0:ax1]
+    return out
+
+class TemporalFill:
+    """
+    Inpainting for moving backgrounds. A background plate of the masked area is carried along
+    the global motion (phase correlation, integer shifts so it never gets resampled) and
+    refreshed with every pixel the masks leave visible, so the pixels under a static logo are
+    copied from where the background was seen in earlier frames. A few frames of lookahead
+    cover what only shows up later; the leftover holes go to cv2.inpaint (`method`).
+    On a static shot nothing is ever visible under the logo and it behaves like plain inpainting.
+    """
+    def __init__(self, masks, boxes, shape, radius=3, method=cv2.INPAINT_TELEA, lookahead=LOOKAHEAD):
+        h, w = shape[:2]
+        flat = [b for bx in boxes for b in bx]
+        # Work region: every mask box plus room for one frame of motion
+        self.x0, self.y0 = max(0, min(b[0] for b in flat) - REACH), max(0, min(b[1] for b in flat) - REACH)
+        self.x1, self.y1 = min(w, max(b[2] for b in flat) + REACH), min(h, max(b[3] for b in flat) + REACH)
+        rh, rw = self.y1 - self.y0, self.x1 - self.x0
+        self.masks = [m if m is None else (m > 0) for m in masks] # Full frame, for lookahead windows
+        self.clear = np.zeros((h, w), bool) # Lookahead mask of unmasked intervals: every pixel visible
+        self.crops = [m if m is None else m[self.y0:self.y1, self.x0:self.x1] for m in self.masks]
+        self.radius, self.method, self.lookahead = radius, method, lookahead
+
+        # Motion estimate: gray crop of the background around the masks (what the plate has to follow), at full
+        # resolution when it fits. Masked pixels are flattened and weighted out so a static logo doesn't vote for "no motion"
+        mx0, my0 = max(0, self.x0 - MOTION_PAD), max(0, self.y0 - MOTION_PAD)
+        mx1, my1 = min(w, self.x1 + MOTION_PAD), min(h, self.y1 + MOTION_PAD)
+        self.motion_box = (mx0, my0, mx1, my1)
+        self.scale = min(1.0, MOTION_W / (mx1 - mx0))
+        self.small = (max(1, int((mx1 - mx0) * self.scale)), max(1, int((my1 - my0) * self.scale)))
+        hann = cv2.createHanningWindow(self.small, cv2.CV_32F)
+        self.small_masks, self.windows = [], []
+        for m in self.masks:
+            sm = m if m is None else cv2.resize(m[my0:my1, mx0:mx1].astype(np.uint8), self.small, interpolation=cv2.INTER_NEAREST) > 0
+            self.small_masks.append(sm)
+            self.windows.append(hann if sm is None else hann * cv2.GaussianBlur((~sm).astype(np.float32), (0, 0), 4))
+
+        self.plate = np.zeros((rh, rw, 3), np.uint8)
+        self.valid = np.zeros((rh, rw), np.uint8)
+        self.prev = None
+        self.acc = np.zeros(2) # Motion not applied yet (sub-pixel remainder)
+        self.queue = deque() # (index, interval, frame, shift from the previous frame) waiting for lookahead
+        self.spare = []
+        self.masked = self.copied = 0 # Stats: masked pixels seen / filled from the plate or lookahead
+
+    def frames(self, cap, bounds, first=0):
+        """Same contract as the remover's `inpainted`: yields (index, interval, frame) in order, buffers reused."""
+        idx = first
+        while True:
+            buf = self.spare.pop() if self.spare else None
+            ret, frame = cap.read(buf)
+            if not ret: break
+            k = int(np.searchsorted(bounds, idx, side="right")) - 1
+            self.queue.append((idx, k, frame, self._motion(frame, k)))
+            if len(self.queue) > self.lookahead:
+                yield self._fill()
+            idx += 1
+        while self.queue: yield self._fill()
+
+    def report(self):
+        return f"plate={self.copied / self.masked if self.masked else 0:.1%}"
+
+    def _motion(self, frame, k):
+        mx0, my0, mx1, my1 = self.motion_box
+        roi = frame[my0:my1, mx0:mx1]
+        if self.scale < 1: roi = cv2.resize(roi, self.small, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        sm = self.small_masks[k]
+        if sm is not None: gray[sm] = gray[~sm].mean() if not sm.all() else 0
+        prev, self.prev = self.prev, gray
+        if prev is None: return None
+        (dx, dy), resp = cv2.phaseCorrelate(prev, gray, self.windows[k])
+        if resp < MIN_RESPONSE: return None
+        # The window pulls the sub-pixel peak toward zero in proportion to the shift, and the plate
+        # accumulates that bias: measure again with prev moved by the integer estimate, so only a
+        # residual of well under a pixel is left, and drop it when it is within the noise
+        ix, iy = round(dx), round(dy)
+        if ix or iy:
+            moved = cv2.warpAffine(prev, np.float32([[1, 0, ix], [0, 1, iy]]), prev.shape[::-1], borderMode=cv2.BORDER_REPLICATE)
+            (dx, dy), _ = cv2.phaseCorrelate(moved, gray, self.windows[k])
+            dx, dy = ix + dx, iy + dy
+        dx, dy = (round(v) if abs(v - round(v)) < SNAP else v for v in (dx, dy))
+        self.acc += (dx / self.scale, dy / self.scale)
+        d = np.round(self.acc)
+        self.acc -= d
+        return int(d[0]), int(d[1])
+
+    def _fill(self):
+        idx, k, frame, d = self.queue.popleft()
+        if not self.spare: self.spare.append(frame) # Decoded into again once the caller is done with it
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+
+        # 1. Carry the plate along this frame's motion (a cut or the first frame start it over)
+        if d is None: self.valid[:] = 0
+        elif d != (0, 0):
+            M = np.float32([[1, 0, d[0]], [0, 1, d[1]]])
+            self.plate = cv2.warpAffine(self.plate, M, self.plate.shape[1::-1], flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT)
+            self.valid = cv2.warpAffine(self.valid, M, self.valid.shape[::-1], flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT)
+
+        # 2. Refresh it with everything visible now
+        roi = frame[y0:y1, x0:x1]
+        m = self.crops[k]
+        if m is None:
+            np.copyto(self.plate, roi); self.valid[:] = 1
+            return idx, k, frame
+        vis = ~m
+        self.plate[vis] = roi[vis]; self.valid[vis] = 1
+
+        # 3. Holes the plate can't fill: look for them in the next frames (frame t+j at p + D shows frame t at p)
+        holes = m & (self.valid == 0)
+        D = np.zeros(2, int)
+        for _, kj, fj, dj in self.queue:
+            if not holes.any() or dj is None: break
+            D += dj
+            mj = self.clear if self.masks[kj] is None else self.masks[kj]
+            ok = holes & ~_window(mj, x0 + D[0], y0 + D[1], x1 + D[0], y1 + D[1], True)
+            if ok.any():
+                src = _window(fj, x0 + D[0], y0 + D[1], x1 + D[0], y1 + D[1])
+                self.plate[ok] = src[ok]; self.valid[ok] = 1
+                holes &= ~ok
+
+        # 4. Copy from the plate, diffuse what is left
+        fill = m & (self.valid > 0)
+        roi[fill] = self.plate[fill]
+        n = int(np.count_nonzero(m))
+        self.masked += n; self.copied += n - int(np.count_nonzero(holes))
+        if holes.any():
+            hm = holes.astype(np.uint8)
+            ys, xs = np.nonzero(hm)
+            r = self.radius + 1
+            bx0, by0 = max(0, xs.min() - r), max(0, ys.min() - r)
+            bx1, by1 = min(hm.shape[1], xs.max() + 1 + r), min(hm.shape[0], ys.max() + 1 + r)
+            sub = roi[by0:by1, bx0:bx1]
+            sub[:] = cv2.inpaint(np.ascontiguousarray(sub), hm[by0:by1, bx0:bx1], self.radius, self.method)
+        return idx, k, frame
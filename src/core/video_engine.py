@@ -1,9 +1,22 @@
 import cv2
 import subprocess
 import os
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
 import numpy as np
 import urllib.request
 from src.utils.file_manager import FileManager
+from src.core.matting import upsample_mask, downscale, band_matte, TemporalSmoother
+from src.core.compositor import Compositor
+from src.core.decoder import open_video, probe, keyframes, DECODER
+from src.core.mask_cache import sidecar_path, open_sidecar, join_sidecar, MaskWriter
+from src.core.seq_writer import SequenceWriter, SEQ_FORMATS
+from src.core.model_registry import REGISTRY
+from src.core.keyers import BackgroundKeyer, ChromaKeyer
+from concurrent.futures import ProcessPoolExecutor
 
 # Try imports
 try:
@@ -12,48 +25,128 @@ try:
 except: MP_AVAIL = False
 
 try:
-    from rembg import remove, new_session
+    from rembg import remove
+    from rembg.bg import alpha_matting_cutout
+    from PIL import Image
     REMBG_AVAIL = True
 except: REMBG_AVAIL = False
 
+TURBO_MODEL = "src/assets/models/selfie_segmenter.tflite"
+
+def n_workers(workers):
+    return workers or max(1, (os.cpu_count() or 2) - 2) # Segmentation threads (0 = auto)
+SEG_ENGINES = ("magic", "cascade", "turbo") # Engines whose masks edge matting refines
+
+# rembg preprocessing per model (mean, std, input size), used by the batched path
+BATCH_SPECS = {
+    "u2net": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "u2net_human_seg": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "isnet-anime": ((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+FLOW_W = 320 # Working width for keyframe drift checks and dense mask propagation
+ROI_W = 256 # Thumbnail width for the cascade's MediaPipe subject search
+
+_seg_pool = [] # Idle IMAGE-mode MediaPipe segmenters (warm-up, previous runs), reused instead of rebuilt
+_seg_lock = threading.Lock()
+
+AUDIO_CODECS = {"webm": "libvorbis", "green": "aac", "alpha": "pcm_s16le"} # MOV/PNG usually pcm
+
 class VideoEngine:
     def __init__(self, callback_progress=None, callback_status=None):
         self.upd = callback_progress
         self.stat = callback_status
         self.stop_flag = False
+        self.decoder = DECODER # "ffmpeg" or "opencv"
         self.rembg_session = None
         self.current_model = None
+        self.rembg_workers = 1 # Worker threads the session's intra-op threads were sized for
+        self.batch_ok = True # False once the model rejects batch sizes > 1
+        self._grid = None # Cached pixel grid for flow warping
 
-    def load_rembg(self, model_name):
+    def load_rembg(self, model_name, workers=1):
         if not REMBG_AVAIL: return False
-        if self.rembg_session is None or self.current_model != model_name:
-            if self.stat: self.stat(f"Cargando Modelo AI {model_name}...")
-            self.rembg_session = new_session(model_name)
+        if self.rembg_session is None or self.current_model != model_name or self.rembg_workers != workers:
+            # Borrowed from the shared registry: other tabs reuse the same session
+            self.rembg_session = REGISTRY.get(model_name, self.stat, workers)
             self.current_model = model_name
+            self.rembg_workers = workers
+            self.batch_ok = True
         return True
 
-    def process_video(self, in_path, engine="turbo", model="u2net", out_fmt="webm", wand_mode=False, tracking_points=None, thresh=0.5, soft=5):
+    def warm_up(self, engine="magic", model="u2net"):
+        """Loads what a run with these settings needs and pushes one dummy frame through it."""
+        dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+        if engine in ("turbo", "cascade") and MP_AVAIL and os.path.exists(TURBO_MODEL):
+            seg = self._new_segmenter()
+            self._segment_frame(dummy, "turbo", seg)
+            self._free_segmenter(seg)
+        if engine in ("magic", "cascade") and REGISTRY.downloaded(model) and self.load_rembg(model, n_workers(0)):
+            self.rembg_session.predict(Image.fromarray(dummy)) # Model-sized run: allocates and tunes every kernel
+
+    def process_video(self, in_path, engine="turbo", model="u2net", out_fmt="webm", wand_mode=False, tracking_points=None, thresh=0.5, soft=5, workers=0, batch=1, key_interval=1, drift_thresh=0.08, infer_scale=1.0, chunks=1, png_level=1, matting="full", mp_mode="image", bg_method="median", key_color="green", key_tol=40, key_soft=30, spill=1.0, stability=0.0):
         if not os.path.exists(in_path): return
+        if engine not in SEG_ENGINES: matting = "none" # Keyers output their own soft alpha (and it keeps the sidecar key stable)
+        opts = dict(engine=engine, model=model, wand_mode=wand_mode, tracking_points=tracking_points, thresh=thresh, soft=soft,
+                    workers=workers, batch=batch, key_interval=key_interval, drift_thresh=drift_thresh, infer_scale=infer_scale,
+                    png_level=png_level, matting=matting, mp_mode=mp_mode, bg_method=bg_method,
+                    key_color=key_color, key_tol=key_tol, key_soft=key_soft, spill=spill, stability=stability)
+        
+        # Tracking follows the points across the whole timeline, so it always runs in one pass
+        if chunks > 1 and not (wand_mode and tracking_points):
+            return self._process_chunked(in_path, out_fmt, chunks, opts)
         
         # Setup Cap
-        cap = cv2.VideoCapture(in_path)
-        w = int(cap.get(3)); h = int(cap.get(4)); fps = cap.get(5)
-        tot = int(cap.get(7))
-        
-        # Configure Output Pipe
-        pipe, out_path, seq_dir = self._get_pipe(in_path, out_fmt, w, h, fps)
-        
-        # Setup Engine
-        seg = None
-        if engine == "turbo" and MP_AVAIL:
-            m_path = "src/assets/models/selfie_segmenter.tflite"
-            if not os.path.exists(m_path):
-                if self.stat: self.stat("Descargando modelo Turbo...")
-                urllib.request.urlretrieve("https://storage.googleapis.com/mediapipe-models/image_segmenter/selfie_segmenter/float16/latest/selfie_segmenter.tflite", m_path)
-            op = mp.tasks.vision.ImageSegmenterOptions(base_options=mp.tasks.BaseOptions(model_asset_path=m_path), running_mode=mp.tasks.vision.RunningMode.IMAGE, output_confidence_masks=True)
-            seg = mp.tasks.vision.ImageSegmenter.create_from_options(op)
-        elif engine == "magic":
-            self.load_rembg(model)
+        cap = open_video(in_path, backend=self.decoder)
+        
+        # Mask sidecar: raw masks are stored once, re-exports (format, sensitivity, softness) skip the AI
+        side = self._sidecar(in_path, opts)
+        masks_in = masks_out = None
+        if side and os.path.exists(side):
+            if self.stat: self.stat("Máscara guardada encontrada: exportando sin IA...")
+            masks_in = open_sidecar(side)
+        elif side:
+            masks_out = MaskWriter(side, cap.w, cap.h, cap.fps)
+        keyer = self._background(in_path, opts) if engine == "bgsub" and not masks_in else None
+        
+        # Configure Output Pipe (audio is mapped from the source by the same encoder)
+        pipe, out_path, seq_dir = self._get_pipe(in_path, out_fmt, cap.w, cap.h, cap.fps)
+        done = False
+        try:
+            cnt = self._render(cap, pipe, seq_dir, out_fmt, masks_in=masks_in, masks_out=masks_out, keyer=keyer, **opts)
+            done = not self.stop_flag and cnt == cap.frames # Only a complete mask track is ever replayed
+        except Exception as e:
+            if self.stat: self.stat(f"Error de segmentación: {e}")
+            if out_path and os.path.exists(out_path): os.remove(out_path) # Truncated export
+            return None
+        finally:
+            if masks_in: masks_in.release()
+            if masks_out: masks_out.close(keep=done)
+            
+        return seq_dir if out_fmt in SEQ_FORMATS else out_path
+
+    def _render(self, cap, pipe, seq_dir, out_fmt, engine="turbo", model="u2net", wand_mode=False, tracking_points=None, thresh=0.5, soft=5, workers=0, batch=1, key_interval=1, drift_thresh=0.08, infer_scale=1.0, png_level=1, matting="full", mp_mode="image", bg_method="median", key_color="green", key_tol=40, key_soft=30, spill=1.0, stability=0.0, keyer=None, first=1, masks_in=None, masks_out=None):
+        # Runs decode -> segment -> write over every frame `cap` yields; `first` numbers PNG frames.
+        # masks_in replays raw masks from a sidecar instead of running a model, masks_out records them.
+        # keyer is the BackgroundKeyer of the "bgsub" engine (built once from the whole clip).
+        # "chroma" keys each frame and despills it, even when its mask is replayed.
+        # Returns the number of frames written; any thread's failure is re-raised once all are joined.
+        w, h = cap.w, cap.h
+        tot = max(cap.frames, 1)
+        comp = Compositor(w, h, out_fmt)
+        seq = SequenceWriter(seq_dir, out_fmt, png_level) if seq_dir else None
+        
+        # Setup Engine (shared resources are loaded once, before the workers start)
+        # Cascade: MediaPipe finds the subject, rembg only sees the padded crop
+        if engine == "cascade" and not MP_AVAIL: engine = "magic"
+        seg_engine = None if masks_in else engine
+        if engine == "chroma": keyer = ChromaKeyer(key_color, key_tol, key_soft, spill)
+        if masks_in or engine == "chroma": key_interval = 1 # Keying a frame is cheaper than warping a mask
+        elif engine in ("turbo", "cascade") and MP_AVAIL:
+            self._ensure_turbo_model()
+        n_work = n_workers(workers)
+        if seg_engine in ("magic", "cascade"):
+            self.load_rembg(model, n_work)
             
         # Tracking Vars
         lk_params = dict(winSize=(15,15), maxLevel=2, criteria=(cv2.TERM_CRITERIA_EPS|cv2.TERM_CRITERIA_COUNT,10,0.03))
@@ -61,73 +154,448 @@ class VideoEngine:
         if wand_mode and tracking_points:
              curr_pts = np.array(tracking_points, dtype=np.float32).reshape(-1, 1, 2)
         else: curr_pts = None
+        
+        # Keyframe Vars: the model only runs every K frames (or on drift), masks in between are warped by flow
+        fw = min(FLOW_W, w); fh = max(1, int(h * fw / w))
+        prev_mask = None; prev_small = None
+        
+        # Temporal smoothing of the raw masks (after recording them, so the sidecar stays raw)
+        smoother = TemporalSmoother(w, h, stability) if stability > 0 else None
+
+        # Pipeline: decoder thread -> N segmentation workers -> ordered writer (this thread).
+        # Bounded queues give backpressure so a slow encoder never piles up decoded frames.
+        # MediaPipe VIDEO / LIVE_STREAM modes track the subject across frames: one segmenter sees every frame in order
+        mp_mode = mp_mode if seg_engine == "turbo" and MP_AVAIL else "image"
+        if mp_mode != "image": n_work = 1
+        n_batch = batch if seg_engine in ("magic", "cascade") and REMBG_AVAIL and self.current_model in BATCH_SPECS else 1
+        q_in = queue.Queue(maxsize=n_work * max(2, n_batch))
+        q_out = queue.Queue(maxsize=n_work * 4)
+        abort = threading.Event()
+        errors = [] # First failure of any thread, re-raised once everything is joined
+
+        def _decode():
+            idx = 0
+            key_small = None; since_key = 0
+            roi_seg = self._new_segmenter() if seg_engine == "cascade" else None
+            roi_state = None; roi = None
+            try:
+                while cap.isOpened() and not self.stop_flag and not abort.is_set():
+                    ret, frame = cap.read()
+                    if not ret: break
+                    idx += 1
+                    
+                    # Replay: the stored raw mask travels with the frame, no model involved
+                    if masks_in:
+                        ret, raw = masks_in.read()
+                        if not ret or not self._put(q_in, (idx, frame, False, None, raw), abort): break
+                        continue
+                    
+                    # Keyframe decision: interval elapsed, or the scene drifted too far from the last keyframe
+                    key = True
+                    if key_interval > 1:
+                        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+                        key = (key_small is None or since_key >= key_interval or
+                               cv2.norm(small, key_small, cv2.NORM_L1) / (small.size * 255.0) > drift_thresh)
+                        if key: key_small = small; since_key = 0
+                        since_key += 1
+                    
+                    # Subject ROI (sequential so the box can be smoothed over time)
+                    if roi_seg and key:
+                        roi_state, roi = self._subject_roi(roi_seg, frame, roi_state)
+                    if not self._put(q_in, (idx, frame, key, roi, None), abort): break
+            except Exception as e:
+                errors.append(e)
+                abort.set()
+            finally:
+                if roi_seg: self._free_segmenter(roi_seg)
+                for _ in range(n_work): self._put(q_in, None, abort)
+
+        def _refine(f, roi, c, m):
+            m = upsample_mask(m, c)
+            if matting == "band" and engine in SEG_ENGINES: m = band_matte(c, m)
+            if roi is not None: # Paste the crop back into a full-size mask
+                full = np.zeros(f.shape[:2], dtype=np.uint8)
+                full[roi[1]:roi[3], roi[0]:roi[2]] = m
+                m = full
+            return m
+
+        # LIVE_STREAM: results arrive on MediaPipe's thread while the worker keeps feeding frames.
+        # Frames MediaPipe dropped (it skips input while busy) reuse the previous mask.
+        live = {} # timestamp -> (idx, frame) awaiting a result
+        live_last = [None]
+        live_lock = threading.Lock()
+
+        def _live_done(ts, m):
+            with live_lock:
+                done = sorted(t for t in live if t <= ts)
+                items = [live.pop(t) for t in done]
+            for t, (idx, frame) in zip(done, items):
+                if t == ts and m is not None: live_last[0] = _refine(frame, None, frame, m)
+                mask = live_last[0] if live_last[0] is not None else np.zeros(frame.shape[:2], dtype=np.uint8)
+                self._put(q_out, (idx, frame, mask), abort)
+
+        def _on_live(res, _img, ts):
+            _live_done(ts, (res.confidence_masks[0].numpy_view() * 255).astype(np.uint8) if res.confidence_masks else None)
+
+        def _segment():
+            seg = self._new_segmenter(mp_mode, _on_live) if seg_engine == "turbo" and MP_AVAIL else None
+            if seg_engine == "bgsub": seg = keyer.worker()
+            elif seg_engine == "chroma": seg = keyer
+            try:
+                while True:
+                    items = []
+                    while len(items) < n_batch:
+                        item = self._get(q_in, abort)
+                        if item is None: break
+                        items.append(item)
+                    if not items: break
+                    
+                    # Only keyframes hit the model (cropped to the ROI, optionally downscaled),
+                    # the rest travel with their replayed mask or mask=None
+                    if mp_mode == "live":
+                        idx, frame, key, _, raw = items[0]
+                        if key:
+                            small = downscale(frame, infer_scale)
+                            ts = self._timestamp(idx + first - 1, cap.fps)
+                            with live_lock: live[ts] = (idx, frame)
+                            seg.segment_async(mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(small, cv2.COLOR_BGR2RGB)), ts)
+                        elif not self._put(q_out, (idx, frame, raw), abort): break
+                        continue
+                    
+                    keys = [(i, f, roi) for i, f, key, roi, _ in items if key]
+                    crops = [f if roi is None else f[roi[1]:roi[3], roi[0]:roi[2]] for _, f, roi in keys]
+                    small = [downscale(c, infer_scale) for c in crops]
+                    if len(small) > 1: raw = self._segment_batch(small, matting)
+                    elif mp_mode == "video": raw = [self._segment_frame(c, engine, seg, matting, self._timestamp(i + first - 1, cap.fps)) for (i, _, _), c in zip(keys, small)]
+                    else: raw = [self._segment_frame(c, engine, seg, matting) for c in small]
+                    masks = iter([_refine(f, roi, c, m) for (_, f, roi), c, m in zip(keys, crops, raw)])
+                    if engine == "chroma": # After keying: the despilled colors no longer match the screen
+                        for it in items: keyer.despill(it[1])
+                    
+                    if not all(self._put(q_out, (idx, frame, next(masks) if key else raw), abort) for idx, frame, key, _, raw in items): break
+                    if len(items) < n_batch: break # End of stream reached mid-batch
+            except Exception as e:
+                errors.append(e)
+                abort.set()
+            finally:
+                turbo = seg_engine == "turbo" and seg # bgsub/chroma workers hold a plain keyer
+                if turbo and mp_mode == "image": self._free_segmenter(seg)
+                elif turbo:
+                    seg.close() # Flushes pending LIVE_STREAM results through the callback
+                    if live: _live_done(max(live), None)
+                self._put(q_out, None, abort)
+
+        threads = [threading.Thread(target=_decode, daemon=True)]
+        threads += [threading.Thread(target=_segment, daemon=True) for _ in range(n_work)]
+        for t in threads: t.start()
 
         cnt = 0
-        while cap.isOpened() and not self.stop_flag:
-            ret, frame = cap.read()
-            if not ret: break
-            cnt += 1
+        pending = {} # Out-of-order results waiting for their turn
+        finished = 0
+        try:
+            while finished < n_work:
+                item = self._get(q_out, abort)
+                if item is None:
+                    if abort.is_set(): break
+                    finished += 1
+                    continue
+                pending[item[0]] = item[1:]
+                
+                while cnt + 1 in pending:
+                    frame, mask = pending.pop(cnt + 1)
+                    cnt += 1
+                    
+                    # 1b. Mask Propagation (non-keyframes)
+                    if key_interval > 1 or smoother:
+                        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (fw, fh), interpolation=cv2.INTER_AREA)
+                    if key_interval > 1:
+                        if mask is None:
+                            mask = self._propagate_mask(prev_mask, prev_small, small)
+                        prev_mask = mask; prev_small = small
+                    
+                    # 1c. Record the raw mask, then threshold (thresholding always allocates a new mask)
+                    if masks_out: masks_out.write(mask)
+                    if smoother: mask = smoother(mask, small)
+                    mask = self._apply_thresh(mask, engine, thresh)
+
+                    # 2. Wand Tracking Overlay (sequential: depends on the previous frame)
+                    if wand_mode and curr_pts is not None:
+                        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                        if prev_gray is not None:
+                             p1, st, err = cv2.calcOpticalFlowPyrLK(prev_gray, gray, curr_pts, None, **lk_params)
+                             good_new = p1[st==1]
+                             if len(good_new) > 0:
+                                 curr_pts = good_new.reshape(-1, 1, 2)
+                                 # Draw tracked mask
+                                 for pt in curr_pts:
+                                     cv2.circle(mask, (int(pt[0][0]), int(pt[0][1])), 30, 255, -1)
+                        prev_gray = gray
+
+                    # 3. Feathering
+                    if soft > 1 and soft % 2 == 1:
+                        mask = cv2.GaussianBlur(mask, (soft, soft), 0)
+
+                    # 4. Output Writing
+                    self._write_frame(comp.compose(frame, mask), pipe, seq, cnt + first - 1)
+                    
+                    # Progress
+                    if cnt % 5 == 0 and self.upd:
+                        self.upd(cnt/tot, f"Procesando: {int(cnt/tot*100)}%")
+        finally:
+            abort.set()
+            for t in threads: t.join()
+            cap.release()
+            if pipe:
+                try: pipe.stdin.close()
+                except BrokenPipeError: pass # Encoder already gone, its exit code tells how
+                pipe.wait()
+            if seq: seq.close()
+        if errors: raise errors[0]
+        return cnt
+
+    def _process_chunked(self, in_path, out_fmt, chunks, opts):
+        # Time-sliced mode: segments split at keyframes, one process (and model session) each,
+        # joined losslessly with the concat demuxer in the same pass that maps the audio
+        info = probe(in_path)
+        bounds = self._chunk_bounds(keyframes(in_path), info["frames"], chunks)
+        side = self._sidecar(in_path, opts)
+        rec = side if side and not os.path.exists(side) else None # No sidecar yet: each chunk records its range
+        side = None if rec else side
+        if len(bounds) < 2:
+            return self.process_video(in_path, out_fmt=out_fmt, chunks=1, **opts)
+        opts["workers"] = opts["workers"] or max(1, (os.cpu_count() or 2) // len(bounds))
+        keyer = self._background(in_path, opts, info) if opts["engine"] == "bgsub" and not side else None
+        
+        _, out_path, seq_dir = self._get_pipe(in_path, out_fmt, 0, 0, 0, open_pipe=False)
+        os.makedirs("temp", exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix="chunks_", dir="temp")
+        ext = os.path.splitext(out_path)[1] if out_path else ""
+        segs = [os.path.join(tmp, f"seg_{i:03d}{ext}") for i in range(len(bounds))]
+        msegs = [os.path.join(tmp, f"mask_{i:03d}.mkv") if rec else None for i in range(len(bounds))]
+        
+        if self.stat: self.stat(f"Procesando en {len(bounds)} segmentos paralelos...")
+        ctx = multiprocessing.get_context("spawn")
+        try:
+            with ctx.Manager() as mgr, ProcessPoolExecutor(len(bounds), mp_context=ctx) as pool:
+                progress = mgr.Queue(); stop = mgr.Event()
+                futs = [pool.submit(_render_chunk, in_path, out_fmt, seg, seq_dir, s, e, i, self.decoder, side, mseg, dict(opts, keyer=keyer), progress, stop)
+                        for i, (seg, mseg, (s, e)) in enumerate(zip(segs, msegs, bounds))]
+                
+                # Combine per-chunk progress (fractions weighted by chunk length)
+                done = [0.0] * len(bounds)
+                tot = max(info["frames"], 1)
+                while not all(f.done() for f in futs):
+                    if self.stop_flag: stop.set()
+                    try:
+                        i, v = progress.get(timeout=0.2)
+                        done[i] = v * (bounds[i][1] - bounds[i][0])
+                        if self.upd: self.upd(sum(done)/tot, f"Procesando: {int(sum(done)/tot*100)}%")
+                    except queue.Empty: pass
+                ok = all(f.result() for f in futs)
+            
+            # Mask segments exist only for complete chunks, so the joined sidecar covers every frame
+            if rec and ok and not self.stop_flag and all(os.path.exists(p) for p in msegs):
+                join_sidecar(msegs, rec)
+            
+            if not ok or self.stop_flag or seq_dir:
+                return seq_dir if seq_dir else None
             
-            # 1. Mask Generation
-            mask = np.zeros((h,w), dtype=np.uint8)
-            if engine == "magic" and REMBG_AVAIL:
-                # Optimized: Convert only once
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                res = remove(rgb, session=self.rembg_session, alpha_matting=True)
-                mask = res[:,:,3] # Alpha channel
-                # Thresholding
-                _, mask = cv2.threshold(mask, int(thresh*255), 255, cv2.THRESH_TOZERO)
+            # Lossless join + audio from the source (no -shortest: a shorter audio track would cut the video)
+            if self.stat: self.stat("Uniendo segmentos...")
+            list_path = os.path.join(tmp, "list.txt")
+            with open(list_path, "w") as f:
+                for p in segs:
+                    f.write("file '{}'\n".format(os.path.abspath(p).replace("'", "'\\''")))
+            cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-i", in_path,
+                   "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", "-c:a", AUDIO_CODECS[out_fmt], out_path]
+            res = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if res.returncode != 0:
+                print(f"Concat Error: {res.stderr.decode()}")
+                return None
+            return out_path
+        except Exception as e: # A chunk's segmentation failure comes back through its future
+            if self.stat: self.stat(f"Error de segmentación: {e}")
+            return None
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _sidecar(self, in_path, opts):
+        keys = ("engine", "model", "key_interval", "drift_thresh", "infer_scale", "matting", "mp_mode", "bg_method", "key_color", "key_tol", "key_soft")
+        return sidecar_path(in_path, **{k: opts[k] for k in keys})
+
+    def _background(self, in_path, opts, info=None):
+        if self.stat: self.stat("Modelando fondo estático...")
+        return BackgroundKeyer.from_video(in_path, opts["bg_method"], backend=self.decoder, info=info)
+
+    def _chunk_bounds(self, keys, tot, chunks):
+        # Cut points at the keyframe nearest to each even split, as [start, end) frame ranges
+        if tot <= 0: return []
+        cuts = set()
+        for i in range(1, chunks):
+            target = i * tot / chunks
+            cut = min(keys, key=lambda k: abs(k - target)) if keys else int(target)
+            if 0 < cut < tot: cuts.add(cut)
+        edges = [0] + sorted(cuts) + [tot]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _ensure_turbo_model(self):
+        if not os.path.exists(TURBO_MODEL):
+            if self.stat: self.stat("Descargando modelo Turbo...")
+            urllib.request.urlretrieve("https://storage.googleapis.com/mediapipe-models/image_segmenter/selfie_segmenter/float16/latest/selfie_segmenter.tflite", TURBO_MODEL)
+
+    def _new_segmenter(self, mode="image", callback=None):
+        # MediaPipe segmenters are not thread-safe: one instance per worker (IMAGE ones come from the idle pool when possible)
+        if mode == "image":
+            with _seg_lock:
+                if _seg_pool: return _seg_pool.pop()
+        running = {"image": mp.tasks.vision.RunningMode.IMAGE, "video": mp.tasks.vision.RunningMode.VIDEO,
+                   "live": mp.tasks.vision.RunningMode.LIVE_STREAM}[mode]
+        op = mp.tasks.vision.ImageSegmenterOptions(base_options=mp.tasks.BaseOptions(model_asset_path=TURBO_MODEL), running_mode=running,
+                                                   output_confidence_masks=True, result_callback=callback if mode == "live" else None)
+        return mp.tasks.vision.ImageSegmenter.create_from_options(op)
+
+    def _free_segmenter(self, seg):
+        with _seg_lock:
+            if len(_seg_pool) < (os.cpu_count() or 2):
+                _seg_pool.append(seg); return
+        seg.close()
+
+    def _timestamp(self, idx, fps):
+        # VIDEO / LIVE_STREAM need strictly increasing millisecond timestamps
+        return int(idx * 1000 / fps)
+
+    def _segment_frame(self, frame, engine, seg, matting="full", ts=None):
+        # 1. Mask Generation (raw 0-255 confidence, thresholded later at full resolution)
+        mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+        if engine in ("magic", "cascade") and REMBG_AVAIL:
+            # Optimized: Convert only once
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            res = remove(rgb, session=self.rembg_session, alpha_matting=(matting == "full"))
+            mask = res[:,:,3] # Alpha channel
+            
+        elif engine == "turbo" and seg:
+            img = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            res = seg.segment(img) if ts is None else seg.segment_for_video(img, ts)
+            if res.confidence_masks:
+                m_float = res.confidence_masks[0].numpy_view()
+                mask = (m_float * 255).astype(np.uint8)
                 
-            elif engine == "turbo" and seg:
-                res = seg.segment(mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
-                if res.confidence_masks:
-                    m_float = res.confidence_masks[0].numpy_view()
-                    mask = (m_float > thresh).astype(np.uint8) * 255
-
-            # 2. Wand Tracking Overlay
-            if wand_mode and curr_pts is not None:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                if prev_gray is not None:
-                     p1, st, err = cv2.calcOpticalFlowPyrLK(prev_gray, gray, curr_pts, None, **lk_params)
-                     good_new = p1[st==1]
-                     if len(good_new) > 0:
-                         curr_pts = good_new.reshape(-1, 1, 2)
-                         # Draw tracked mask
-                         for pt in curr_pts:
-                             cv2.circle(mask, (int(pt[0][0]), int(pt[0][1])), 30, 255, -1)
-                prev_gray = gray
-
-            # 3. Feathering
-            if soft > 1 and soft % 2 == 1:
-                mask = cv2.GaussianBlur(mask, (soft, soft), 0)
-
-            # 4. Output Writing
-            self._write_frame(frame, mask, out_fmt, pipe, seq_dir, cnt)
+        elif engine == "bgsub" and seg:
+            mask = seg(frame)
             
-            # Progress
-            if cnt % 5 == 0 and self.upd:
-                self.upd(cnt/tot, f"Procesando: {int(cnt/tot*100)}%")
+        elif engine == "chroma" and seg:
+            mask = seg.matte(frame)
+        return mask
+
+    def _apply_thresh(self, mask, engine, thresh):
+        # Magic and Chroma keep the soft alpha above the threshold, Turbo is a hard cut
+        mode = cv2.THRESH_TOZERO if engine in ("magic", "cascade", "chroma") else cv2.THRESH_BINARY
+        _, mask = cv2.threshold(mask, int(thresh*255), 255, mode)
+        return mask
 
-        cap.release()
-        if pipe: pipe.stdin.close(); pipe.wait()
+    def _subject_roi(self, seg, frame, state, pad=0.15, smooth=0.7):
+        # Cheap MediaPipe pass on a thumbnail; returns (smoothed box state, padded int box or None)
+        h, w = frame.shape[:2]
+        small = downscale(frame, ROI_W / w)
+        res = seg.segment(mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(small, cv2.COLOR_BGR2RGB)))
+        ys, xs = (np.nonzero(res.confidence_masks[0].numpy_view() > 0.2) if res.confidence_masks else ((), ()))
+        if len(xs) == 0: # Subject lost: keep the last box, or segment the full frame
+            return state, None if state is None else self._roi_box(state, w, h)
         
-        # Audio Muxing
-        if not self.stop_flag and out_fmt != "png_seq":
-            self._mux_audio(in_path, out_path, out_fmt)
-            
-        return out_path if out_fmt != "png_seq" else seq_dir
+        sx = w / small.shape[1]; sy = h / small.shape[0]
+        box = np.array([xs.min()*sx, ys.min()*sy, (xs.max()+1)*sx, (ys.max()+1)*sy])
+        px = (box[2]-box[0]) * pad; py = (box[3]-box[1]) * pad
+        box += (-px, -py, px, py)
+        
+        # Exponential smoothing stops the crop from jittering, the union keeps fast motion inside it
+        state = box if state is None else smooth*state + (1-smooth)*box
+        out = np.concatenate([np.minimum(state[:2], box[:2]), np.maximum(state[2:], box[2:])])
+        return state, self._roi_box(out, w, h)
+
+    def _roi_box(self, box, w, h):
+        x0, y0, x1, y1 = box
+        x0 = int(max(0, x0)); y0 = int(max(0, y0))
+        x1 = int(min(w, np.ceil(x1))); y1 = int(min(h, np.ceil(y1)))
+        return (x0, y0, x1, y1) if x1 - x0 > 8 and y1 - y0 > 8 else None
+
+    def _segment_batch(self, frames, matting="full"):
+        # Batched rembg: one preprocessing pass and one session run for N frames
+        mean, std, size = BATCH_SPECS[self.current_model]
+        rgbs = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames]
+        x = np.stack([cv2.resize(r, size, interpolation=cv2.INTER_LANCZOS4) for r in rgbs]).astype(np.float32)
+        x /= np.maximum(x.max(axis=(1, 2, 3), keepdims=True), 1)
+        x -= np.array(mean, dtype=np.float32)
+        x /= np.array(std, dtype=np.float32)
+        x = np.ascontiguousarray(x.transpose(0, 3, 1, 2)) # NHWC -> NCHW
+        
+        sess = self.rembg_session.inner_session
+        name = sess.get_inputs()[0].name
+        pred = None
+        if self.batch_ok:
+            try: pred = sess.run(None, {name: x})[0][:, 0]
+            except Exception: self.batch_ok = False # Model exported with a fixed batch of 1
+        if pred is None:
+            pred = np.concatenate([sess.run(None, {name: x[i:i+1]})[0][:, 0] for i in range(len(x))])
+        
+        # Split the mattes back out, in input order
+        masks = []
+        for rgb, p in zip(rgbs, pred):
+            mi, ma = p.min(), p.max()
+            p = ((p - mi) / max(ma - mi, 1e-6) * 255).astype(np.uint8)
+            mask = cv2.resize(p, (rgb.shape[1], rgb.shape[0]), interpolation=cv2.INTER_LANCZOS4)
+            if matting == "full":
+                try: mask = np.asarray(alpha_matting_cutout(Image.fromarray(rgb), Image.fromarray(mask), 240, 10, 10))[:,:,3]
+                except Exception: pass # Same fallback as rembg: keep the raw mask
+            masks.append(mask)
+        return masks
+
+    def _propagate_mask(self, prev_mask, prev_small, small):
+        # Dense backward flow (current -> previous) at low resolution, upscaled to warp the full-res mask
+        h, w = prev_mask.shape
+        flow = cv2.calcOpticalFlowFarneback(small, prev_small, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR)
+        flow *= w / small.shape[1]
+        
+        if self._grid is None or self._grid[0].shape != (h, w):
+            gx, gy = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+            self._grid = (gx, gy)
+        flow[:,:,0] += self._grid[0]
+        flow[:,:,1] += self._grid[1]
+        return cv2.remap(prev_mask, flow, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
 
-    def _get_pipe(self, in_path, fmt, w, h, fps):
-        if fmt == "png_seq":
+    def _put(self, q, item, abort):
+        # Blocking put that gives up once the pipeline is aborted
+        while not abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full: pass
+        return False
+
+    def _get(self, q, abort):
+        while not abort.is_set():
+            try: return q.get(timeout=0.1)
+            except queue.Empty: pass
+        return None
+
+    def _get_pipe(self, in_path, fmt, w, h, fps, out_path=None, open_pipe=True, audio=True):
+        if fmt in SEQ_FORMATS:
             return None, None, FileManager.get_seq_dir(in_path)
             
         suffix = "WebM" if fmt == "webm" else "Green" if fmt == "green" else "Alpha"
         ext = "webm" if fmt == "webm" else "mp4" if fmt == "green" else "mov"
         
-        out_path = FileManager.get_unique_path(in_path, suffix, ext)
+        out_path = out_path or FileManager.get_unique_path(in_path, suffix, ext)
+        if not open_pipe: return None, out_path, None
         
         cmd = ["ffmpeg", "-y", "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{w}x{h}", 
                "-pix_fmt", "bgra" if fmt!="green" else "bgr24", "-r", str(fps), "-i", "-"]
+        
+        # Source as second input: its audio goes in with this single encode.
+        # '1:a:0?' makes audio optional so it doesn't fail if src has no audio; apad + shortest
+        # lets the video set the length (a shorter track would stop the encoder reading stdin)
+        if audio:
+            cmd.extend(["-i", in_path, "-map", "0:v:0", "-map", "1:a:0?", "-c:a", AUDIO_CODECS[fmt], "-af", "apad", "-shortest", "-shortest_buf_duration", "0.5"])
                
         if fmt == "webm":
             cmd.extend(["-c:v", "libvpx-vp9", "-b:v", "2M", "-pix_fmt", "yuva420p", out_path])
@@ -138,51 +606,37 @@ class VideoEngine:
             
         return subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE), out_path, None
 
-    def _write_frame(self, frame, mask, fmt, pipe, seq_dir, cnt):
-        if fmt == "green":
-            bg = np.zeros_like(frame); bg[:] = (0, 255, 0)
-            m_norm = mask / 255.0
-            m3 = np.dstack((m_norm, m_norm, m_norm))
-            fin = (frame * m3 + bg * (1-m3)).astype(np.uint8)
-            pipe.stdin.write(fin.tobytes())
+    def _write_frame(self, fin, pipe, seq, cnt):
+        if pipe:
+            try: pipe.stdin.write(memoryview(fin)) # Compositor buffer, no tobytes() copy
+            except BrokenPipeError:
+                if pipe.wait() != 0: raise # Encoder crashed
+                # Clean exit: the encoder has finished its output, the remaining frames are dropped
         else:
-            b,g,r = cv2.split(frame)
-            b = cv2.bitwise_and(b, b, mask=mask)
-            g = cv2.bitwise_and(g, g, mask=mask)
-            r = cv2.bitwise_and(r, r, mask=mask)
-            fin = cv2.merge((b, g, r, mask))
-            
-            if fmt == "png_seq":
-                cv2.imwrite(os.path.join(seq_dir, f"frame_{cnt:05d}.png"), fin)
-            else:
-                pipe.stdin.write(fin.tobytes())
-
-    def _mux_audio(self, src, dst, fmt):
-        if self.stat: self.stat("Uniendo Audio...")
-        temp = dst + "_temp.mkv"
-        
-        # Verify source exists before rename
-        if not os.path.exists(dst):
-            print(f"Error: Output file {dst} not found.")
-            return
-
-        os.rename(dst, temp)
-        
-        # Map 1:a:0? makes audio optional so it doesn't fail if src has no audio
-        cmd = ["ffmpeg", "-y", "-i", temp, "-i", src, "-c:v", "copy", "-map", "0:v:0", "-map", "1:a:0?", "-shortest"]
-        
-        if fmt == "webm": cmd.extend(["-c:a", "libvorbis", dst])
-        elif fmt == "green": cmd.extend(["-c:a", "aac", dst])
-        else: cmd.extend(["-c:a", "pcm_s16le", dst]) # MOV/ProRes usually pcm
-        
-        # Run and capture output for debug
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        if res.returncode != 0:
-             print(f"Mux Warning: {res.stderr.decode()}")
-             # Restore temp if failed
-             if os.path.exists(temp):
-                 if os.path.exists(dst): os.remove(dst)
-                 os.rename(temp, dst)
-        else:
-            if os.path.exists(temp): os.remove(temp)
+            seq.write(fin, cnt)
+
+
+def _render_chunk(in_path, out_fmt, seg_path, seq_dir, start, end, idx, decoder, side, mask_seg, opts, progress, stop):
+    # Process-pool entry point: renders frames [start, end) into its own segment file
+    # (replaying the matching range of the mask sidecar when there is one, else recording it into mask_seg)
+    eng = VideoEngine()
+    eng.decoder = decoder
+    def _upd(val, txt):
+        progress.put((idx, val))
+        if stop.is_set(): eng.stop_flag = True
+    eng.upd = _upd
+    
+    cap = open_video(in_path, start, end, backend=decoder)
+    # Sequences write into the shared seq_dir (asking _get_pipe would create a stray folder)
+    pipe = None if seq_dir else eng._get_pipe(in_path, out_fmt, cap.w, cap.h, cap.fps, out_path=seg_path, audio=False)[0]
+    masks_in = open_sidecar(side, start, end) if side else None
+    masks_out = MaskWriter(mask_seg, cap.w, cap.h, cap.fps, cache=False) if mask_seg else None
+    done = False
+    try:
+        cnt = eng._render(cap, pipe, seq_dir, out_fmt, first=start + 1, masks_in=masks_in, masks_out=masks_out, **opts)
+        done = not eng.stop_flag and cnt == cap.frames
+    finally:
+        if masks_in: masks_in.release()
+        if masks_out: masks_out.close(keep=done)
+    progress.put((idx, 1.0))
+    return not eng.stop_flag
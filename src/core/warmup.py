@@ -0,0 +1,44 @@
+import json
+import os
+import threading
+from src.core.video_engine import VideoEngine
+
+SETTINGS_FILE = "src/data/settings.json"
+DEFAULTS = {"vid_engine": "magic", "vid_model": "isnet-anime", "img_model": "u2net"}
+
+def load_settings():
+    if os.path.exists(SETTINGS_FILE):
+        try:
+            with open(SETTINGS_FILE, "r") as f: return {**DEFAULTS, **json.load(f)}
+        except: pass
+    return dict(DEFAULTS)
+
+def remember(**kw):
+    """Stores the last-used engine/model so the next start warms up the right things."""
+    s = load_settings()
+    if all(s.get(k) == v for k, v in kw.items()): return
+    s.update(kw)
+    try:
+        with open(SETTINGS_FILE, "w") as f: json.dump(s, f)
+    except: pass
+
+def start_warmup():
+    """
+    Preloads the last-used models on a background thread and runs one dummy inference each,
+    so the first PROCESAR starts at steady-state speed. Sessions land in the shared registry
+    (and MediaPipe segmenters in the engine's idle pool), where the tabs pick them up.
+    Models that were never downloaded are skipped: that stays an explicit user action.
+    """
+    s = load_settings()
+
+    def _t():
+        try:
+            eng = VideoEngine()
+            eng.warm_up(s["vid_engine"], s["vid_model"])
+            eng.warm_up("magic", s["img_model"])
+        except Exception as e:
+            print(f"Warm-up: {e}")
+
+    t = threading.Thread(target=_t, daemon=True)
+    t.start()
+    return t
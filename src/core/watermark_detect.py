@@ -0,0 +1,134 @@
+import cv2
+import itertools
+import os
+import shutil
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from src.core.decoder import probe_header
+
+SAMPLES = 200 # Frames spread over the video
+MIN_SAMPLES = 24 # Fewer keyframes than this (short clip, long GOP): sample decoded frames instead
+SEEK_GAP = 2.0 # Videos longer than SAMPLES * SEEK_GAP seconds are sampled with seeks (about one per GOP)
+WIDTH = 640 # Analysis width
+EDGE_T = 90 # Sobel magnitude (gray, 3x3) that counts as an edge
+PERSIST = 0.6 # Fraction of the samples a pixel has to be on an edge
+MIN_AREA = 0.0005 # Components smaller than this fraction of the frame are noise
+MAX_SPAN = 0.6 # Components wider/taller than this fraction of the frame are borders or letterbox edges
+
+def _size(info, width):
+    w = min(width, info["w"])
+    return w, max(2, round(info["h"] * w / info["w"] / 2) * 2)
+
+def _grab(path, t, w, h):
+    # Fast seek: lands on the keyframe before `t` and decodes only that frame
+    cmd = ["ffmpeg", "-v", "error", "-noaccurate_seek", "-ss", f"{t:.3f}", "-skip_frame", "nokey", "-i", path,
+           "-map", "0:v:0", "-frames:v", "1", "-vf", f"scale={w}:{h}:flags=area", "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    try: out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60).stdout
+    except subprocess.TimeoutExpired: return None
+    return np.frombuffer(out, np.uint8).reshape(h, w) if len(out) == w * h else None
+
+def _pipe(path, w, h, n, keyframes=False, step=1):
+    # One decoding pass streaming gray frames: keyframes only, or every `step`-th frame
+    vf = (f"select='not(mod(n\\,{step}))'," if step > 1 else "") + f"scale={w}:{h}:flags=area"
+    cmd = ["ffmpeg", "-v", "error"] + (["-skip_frame", "nokey"] if keyframes else []) + ["-i", path, "-map", "0:v:0", "-vf", vf,
+           "-fps_mode", "passthrough", "-frames:v", str(n), "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            buf = proc.stdout.read(w * h)
+            if len(buf) < w * h: break
+            yield np.frombuffer(buf, np.uint8).reshape(h, w)
+    finally:
+        proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+def _cv_frames(path, n, w, h, total):
+    # No ffmpeg: OpenCV seeks (slower, they decode from the previous keyframe)
+    cap = cv2.VideoCapture(path)
+    for i in np.linspace(0, max(total - 1, 0), n).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(i))
+        ret, f = cap.read()
+        if ret: yield cv2.resize(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), (w, h), interpolation=cv2.INTER_AREA)
+    cap.release()
+
+def sample_frames(path, n=SAMPLES, width=WIDTH, info=None):
+    """
+    Yields gray frames spread over the video, downscaled to `width`, without ever holding them
+    all. Long videos get `n` keyframe-only seeks run in parallel, so the cost depends on `n` and
+    not on the length; shorter ones a single keyframe-only pass, and clips with too few
+    keyframes (long GOPs) every few decoded frames instead.
+    """
+    info = info or probe_header(path) # Only size and length matter here: no full-file packet count
+    w, h = _size(info, width)
+    total = info["frames"]
+    if not shutil.which("ffmpeg"):
+        yield from _cv_frames(path, n, w, h, total)
+        return
+
+    dur = info.get("duration") or (total / info["fps"] if total else 0)
+    if dur > n * SEEK_GAP:
+        seen = set() # Seeks that hit the same keyframe count once
+        with ThreadPoolExecutor(os.cpu_count() or 2) as pool:
+            for f in pool.map(lambda t: _grab(path, t, w, h), np.linspace(dur * 0.02, dur * 0.98, n)):
+                key = f is not None and hash(f.tobytes())
+                if key is False or key in seen: continue
+                seen.add(key)
+                yield f
+        return
+
+    frames = _pipe(path, w, h, n * 4, keyframes=True)
+    head = list(itertools.islice(frames, MIN_SAMPLES))
+    if len(head) < MIN_SAMPLES:
+        frames.close()
+        yield from _pipe(path, w, h, n, step=max(1, total // n))
+        return
+    yield from head
+    yield from frames
+
+def detect_watermark(path, n=SAMPLES, info=None):
+    """
+    Proposes a mask for a static overlay (logo, watermark, channel bug) from sampled frames.
+    Overlay edges stay put while the picture underneath changes, so the candidates are pixels
+    that sit on an edge in most samples and vary less over time than the frame's median pixel
+    (a semi-transparent logo still keeps its outline). Glyphs are merged, holes filled, and
+    specks and frame-wide lines dropped. Returns a 0/255 mask at the video's resolution, or
+    None when nothing stands out.
+    """
+    info = info or probe_header(path)
+
+    # 1. Per-pixel temporal stats, accumulated as the samples stream in
+    w, h = _size(info, WIDTH)
+    s1 = np.zeros((h, w), np.float32)
+    s2 = np.zeros((h, w), np.float32)
+    edges = np.zeros((h, w), np.float32)
+    k = 0
+    for g in sample_frames(path, n, info=info):
+        f = g.astype(np.float32)
+        s1 += f
+        s2 += f * f
+        mag = cv2.magnitude(cv2.Sobel(f, cv2.CV_32F, 1, 0), cv2.Sobel(f, cv2.CV_32F, 0, 1))
+        edges += mag > EDGE_T
+        k += 1
+    if k < 2: raise ValueError("No se pudieron muestrear cuadros del video")
+    mean = s1 / k
+    std = np.sqrt(np.maximum(s2 / k - mean * mean, 0))
+    cand = ((edges >= PERSIST * k) & (std < np.median(std))).astype(np.uint8) * 255
+
+    # 2. Shapes: close the gaps between glyphs, fill the outlines
+    ksz = max(3, w // 50) | 1
+    cand = cv2.morphologyEx(cand, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ksz, ksz)))
+    cnts, _ = cv2.findContours(cand, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    mask = np.zeros((h, w), np.uint8)
+    for c in cnts:
+        x, y, bw, bh = cv2.boundingRect(c)
+        if cv2.contourArea(c) < MIN_AREA * w * h or bw > MAX_SPAN * w or bh > MAX_SPAN * h: continue
+        cv2.drawContours(mask, [c], -1, 255, -1)
+    if not mask.any(): return None
+
+    # 3. Margin for anti-aliased fringes, back to full resolution
+    mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)))
+    mask = cv2.resize(mask, (info["w"], info["h"]), interpolation=cv2.INTER_LINEAR)
+    _, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    return mask
@@ -4,7 +4,7 @@ import os
 from tkinter import filedialog
 from PIL import Image
 from src.core.image_engine import ImageEngine
-from src.utils.config import C_ACCENT
+from src.utils.config import C_ACCENT, MATTING_MODES, CHROMA_COLORS
 
 class ImageTab:
     def __init__(self, parent):
@@ -35,6 +35,21 @@ class ImageTab:
         ctk.CTkRadioButton(f_fmt, text="PNG (Transparente)", variable=self.v_fmt, value="png").pack(side="left", padx=10)
         ctk.CTkRadioButton(f_fmt, text="JPG (Fondo Blanco)", variable=self.v_fmt, value="jpg").pack(side="left", padx=10)
         ctk.CTkRadioButton(f_fmt, text="WEBP (Optimizado)", variable=self.v_fmt, value="webp").pack(side="left", padx=10)
+        
+        ctk.CTkLabel(f_fmt, text="Motor").pack(side="left", padx=(20,5))
+        self.v_eng = ctk.CTkOptionMenu(f_fmt, values=["IA (Rembg)"] + [f"Croma {c}" for c in CHROMA_COLORS], width=130)
+        self.v_eng.set("IA (Rembg)")
+        self.v_eng.pack(side="left")
+        
+        ctk.CTkLabel(f_fmt, text="Escala IA").pack(side="left", padx=(20,5))
+        self.v_scale = ctk.CTkOptionMenu(f_fmt, values=["1.0", "0.75", "0.5", "0.25"], width=80)
+        self.v_scale.set("1.0")
+        self.v_scale.pack(side="left")
+        
+        ctk.CTkLabel(f_fmt, text="Matting").pack(side="left", padx=(20,5))
+        self.v_matting = ctk.CTkOptionMenu(f_fmt, values=list(MATTING_MODES), width=150)
+        self.v_matting.set("Completo (Lento)")
+        self.v_matting.pack(side="left")
 
         # 4. Action
         self.btn_run = ctk.CTkButton(self.frame, text="🚀 PROCESAR IMAGEN", fg_color=C_ACCENT, text_color="black", command=self.run)
@@ -58,7 +73,10 @@ class ImageTab:
         self.lbl_stat.configure(text="Eliminando fondo...")
         
         def _t():
-            out = self.engine.process(self.in_path, fmt=self.v_fmt.get())
+            eng = self.v_eng.get()
+            key = CHROMA_COLORS.get(eng.replace("Croma ", ""), "green")
+            out = self.engine.process(self.in_path, fmt=self.v_fmt.get(), infer_scale=float(self.v_scale.get()), matting=MATTING_MODES[self.v_matting.get()],
+                                      engine="chroma" if eng.startswith("Croma") else "magic", key_color=key)
             self.btn_run.configure(state="normal", text="🚀 PROCESAR IMAGEN")
             
             if out:
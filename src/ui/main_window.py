@@ -10,6 +10,7 @@ from src.ui.audio_tab import AudioTab
 from src.ui.mark_tab import MarkTab
 from src.ui.voice_tab import VoiceTab
 from src.ui.downloads_tab import DownloadsTab
+from src.core.warmup import start_warmup
 
 class MainWindow(ctk.CTk):
     def __init__(self):
@@ -20,6 +21,9 @@ class MainWindow(ctk.CTk):
         
         self.lang = "ES"
         self.init_ui()
+        
+        # Preload last-used models once the window is drawn
+        self.after_idle(start_warmup)
 
     def tr(self, key):
         return LOCALES[self.lang].get(key, key)
@@ -6,10 +6,12 @@ import os
 import subprocess
 import gc
 import time
+import json
 from tkinter import filedialog
 from src.ui.widgets import CanvasPlayer
+from src.core.watermark_detect import detect_watermark
 from src.utils.file_manager import FileManager
-from src.utils.config import C_ACCENT, C_PANEL, FONT_BOLD
+from src.utils.config import C_ACCENT, C_PANEL, FONT_BOLD, INPAINT_ALGOS
 
 class MarkTab:
     def __init__(self, parent):
@@ -30,6 +32,11 @@ class MarkTab:
                            command=lambda: self.player.set_mode("pencil")).pack(side="left", padx=10)
         ctk.CTkRadioButton(f_tool, text="🪄 Varita (Color)", variable=self.v_tool, value="flood", 
                            command=lambda: self.player.set_mode("flood")).pack(side="left", padx=10)
+        self.btn_auto = ctk.CTkButton(f_tool, text="🔍 Auto-detectar", width=130, fg_color=C_PANEL, command=self.auto_detect)
+        self.btn_auto.pack(side="left", padx=10)
+        # Shown only while a detection waits for confirmation
+        self.btn_accept = ctk.CTkButton(f_tool, text="✔ Aceptar", width=90, fg_color=C_ACCENT, text_color="black", command=self.accept_detect)
+        self.btn_discard = ctk.CTkButton(f_tool, text="✖ Descartar", width=90, fg_color=C_PANEL, command=self.discard_detect)
         
         ctk.CTkLabel(self.frame, text="Instrucción: Dibuja sobre la marca para borrarla.").pack()
 
@@ -48,10 +55,27 @@ class MarkTab:
         self.slider = ctk.CTkSlider(f_time, from_=0, to=100, command=self.on_seek)
         self.slider.set(0)
         self.slider.pack(side="left", fill="x", expand=True, padx=10)
+        
+        # 3.2 Time range for the next strokes (e.g. a logo only in the intro)
+        f_rng = ctk.CTkFrame(self.frame, fg_color="transparent")
+        f_rng.pack(pady=2)
+        self.rng_start = None; self.rng_end = None
+        ctk.CTkButton(f_rng, text="⏮ Inicio aquí", width=110, fg_color=C_PANEL, command=self.set_start).pack(side="left", padx=5)
+        ctk.CTkButton(f_rng, text="Fin aquí ⏭", width=110, fg_color=C_PANEL, command=self.set_end).pack(side="left", padx=5)
+        ctk.CTkButton(f_rng, text="↺ Todo el video", width=110, fg_color=C_PANEL, command=self.clear_range).pack(side="left", padx=5)
+        self.lbl_rng = ctk.CTkLabel(f_rng, text="Rango: Todo el video")
+        self.lbl_rng.pack(side="left", padx=10)
 
         # 4. Action
         self.chk_mov = ctk.CTkCheckBox(self.frame, text="Exportar como .MOV (Formato Edición)")
         self.chk_mov.pack(pady=5)
+        self.chk_patch = ctk.CTkCheckBox(self.frame, text="Modo Parche (Solo la zona marcada pasa por Python)")
+        self.chk_patch.pack(pady=5)
+        f_algo = ctk.CTkFrame(self.frame, fg_color="transparent")
+        f_algo.pack(pady=5)
+        ctk.CTkLabel(f_algo, text="Algoritmo:").pack(side="left", padx=5)
+        self.v_algo = ctk.CTkOptionMenu(f_algo, values=list(INPAINT_ALGOS), width=230)
+        self.v_algo.pack(side="left", padx=5)
 
         self.btn_run = ctk.CTkButton(self.frame, text="🧹 BORRAR MARCA", fg_color="red", command=self.run)
         self.btn_run.pack(pady=10, fill="x", padx=50)
@@ -72,17 +96,90 @@ class MarkTab:
             self.lbl_time.configure(text=f"{cur_sec//60:02d}:{cur_sec%60:02d} / {tot_sec//60:02d}:{tot_sec%60:02d}")
 
 
+    def set_start(self):
+        self.rng_start = self.player.cur_idx # The frame on screen, also while playing
+        if self.rng_end is not None and self.rng_end <= self.rng_start: self.rng_end = None
+        self.update_range()
+
+    def set_end(self):
+        self.rng_end = self.player.cur_idx + 1 # Inclusive of the frame on screen
+        if self.rng_start is not None and self.rng_start >= self.rng_end: self.rng_start = None
+        self.update_range()
+
+    def clear_range(self):
+        self.rng_start = self.rng_end = None
+        self.update_range()
+
+    def update_range(self):
+        # New strokes/masks are tied to this range (frames [start, end), None = whole video)
+        if self.rng_start is None and self.rng_end is None:
+            self.player.cur_range = None
+            self.lbl_rng.configure(text="Rango: Todo el video")
+        else:
+            self.player.cur_range = (self.rng_start or 0, self.rng_end)
+            end = "fin" if self.rng_end is None else self.rng_end - 1
+            self.lbl_rng.configure(text=f"Rango: cuadros {self.rng_start or 0} - {end}")
+
+    def show_proposal(self, mask):
+        self.player.propose(mask)
+        self.btn_accept.pack(side="left", padx=5)
+        self.btn_discard.pack(side="left", padx=5)
+
+    def accept_detect(self):
+        self.player.accept_proposal() # Joins the masks with the current time range
+        self.hide_proposal("Marca añadida a la máscara.")
+
+    def discard_detect(self):
+        self.player.discard_proposal()
+        self.hide_proposal("Detección descartada.")
+
+    def hide_proposal(self, txt):
+        self.btn_accept.pack_forget(); self.btn_discard.pack_forget()
+        self.lbl_stat.configure(text=txt)
+
+    def auto_detect(self):
+        # Proposes a mask from sampled frames: shown as a pending overlay, only exported once accepted
+        if not self.in_path: return
+        self.btn_auto.configure(state="disabled")
+        self.lbl_stat.configure(text="Buscando marca de agua...")
+
+        path = self.in_path
+        def _t():
+            try:
+                mask = detect_watermark(path)
+                if mask is None: txt = "No se detectó ninguna marca. Usa el Lápiz o la Varita."
+                else:
+                    self.frame.after(0, lambda: self.show_proposal(mask) if self.in_path == path else None)
+                    txt = "Marca detectada (contorno amarillo): acéptala o descártala."
+            except Exception as e:
+                print(f"Detect Err: {e}")
+                txt = "Error al detectar."
+            self.frame.after(0, lambda: self.lbl_stat.configure(text=txt))
+            self.frame.after(0, lambda: self.btn_auto.configure(state="normal"))
+
+        threading.Thread(target=_t, daemon=True).start()
+
     def load_file(self):
         f = filedialog.askopenfilename()
         if f:
             self.in_path = f
+            self.player.on_info = self.refine_timeline
             self.player.load(f)
+            self.hide_proposal("")
+            self.clear_range()
             # Init slider
             if hasattr(self.player, 'total_frames'):
                 self.slider.configure(from_=0, to=self.player.total_frames)
                 self.slider.set(0)
                 self.on_seek(0)
 
+    def refine_timeline(self):
+        # Exact frame count arrived from the background probe: rescale the slider, keep the position
+        pos = min(int(self.slider.get()), self.player.total_frames)
+        self.slider.configure(from_=0, to=self.player.total_frames)
+        self.slider.set(pos)
+        self.on_seek(pos)
+
 
     def run(self):
         if not self.in_path: return
@@ -97,22 +194,39 @@ class MarkTab:
                 ext = "mov" if self.chk_mov.get() else "mp4"
                 out_path = FileManager.get_unique_path(self.in_path, "Clean", ext)
                 
-                # Save Mask for Subprocess
-                temp_mask = "temp_mask_{}.png".format(int(time.time()))
-                mask = self.player.get_mask(w, h)
-                cv2.imwrite(temp_mask, mask)
-                del mask 
+                # Save Mask(s) for Subprocess: one per frame range when any stroke is tied to a range
+                stamp = int(time.time())
+                rngs = self.player.ranges()
+                temps = []
+                if any(r is not None for r in rngs):
+                    items = []
+                    for i, r in enumerate(rngs):
+                        p = "temp_mask_{}_{}.png".format(stamp, i)
+                        cv2.imwrite(p, self.player.get_mask(w, h, r)); temps.append(p)
+                        items.append({"start": r[0] if r else 0, "end": r[1] if r else None, "mask": p})
+                    temp_mask = "temp_ranges_{}.json".format(stamp)
+                    with open(temp_mask, "w") as f: json.dump(items, f)
+                    mask_arg = ["--ranges", temp_mask]
+                else:
+                    temp_mask = "temp_mask_{}.png".format(stamp)
+                    cv2.imwrite(temp_mask, self.player.get_mask(w, h))
+                    mask_arg = ["--mask", temp_mask]
+                temps.append(temp_mask)
 
                 # Call Isolated Process
                 script_path = os.path.join(os.getcwd(), "src", "core", "remover_process.py")
                 cmd_proc = [
                     sys.executable, script_path,
                     "--input", self.in_path,
-                    "--mask", temp_mask,
+                    *mask_arg,
                     "--output", out_path,
+                    "--workers", "0", # One inpainting process per spare core
+                    "--algo", INPAINT_ALGOS[self.v_algo.get()],
                 ]
                 if self.chk_mov.get():
                     cmd_proc.append("--mov")
+                if self.chk_patch.get():
+                    cmd_proc.append("--patch")
 
                 # Run Process and Monitor
                 # We do NOT capture stderr here to avoid buffering issues on the UI side.
@@ -126,9 +240,14 @@ class MarkTab:
                     if line:
                         if line.startswith("PROGRESS:"):
                             try:
-                                v = float(line.split(":")[1])
+                                # "PROGRESS:<fraction> [cache=<hit rate> saved=<seconds>]"
+                                val, *extra = line.split(":", 1)[1].split()
+                                v = float(val)
+                                info = dict(e.split("=", 1) for e in extra if "=" in e)
+                                txt = f"Procesando: {int(v*100)}%"
+                                if "cache" in info: txt += f"  ·  Caché {info['cache']} (ahorro {info.get('saved', '0s')})"
                                 self.frame.after(0, lambda v=v: self.prog.set(v))
-                                self.frame.after(0, lambda v=v: self.lbl_stat.configure(text=f"Procesando: {int(v*100)}%"))
+                                self.frame.after(0, lambda t=txt: self.lbl_stat.configure(text=t))
                             except: pass
                 
                 if process.returncode != 0:
@@ -139,8 +258,9 @@ class MarkTab:
                     print(f"Worker Error: {err}")
                     raise Exception(f"Worker process failed. {err}")
                 
-                # Cleanup temp mask
-                if os.path.exists(temp_mask): os.remove(temp_mask)
+                # Cleanup temp mask(s)
+                for p in temps:
+                    if os.path.exists(p): os.remove(p)
 
                 self.frame.after(0, lambda: self.btn_run.configure(state="normal"))
                 self.frame.after(0, lambda: self.lbl_stat.configure(text=f"¡Guardado! {os.path.basename(out_path)}"))
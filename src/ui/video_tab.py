@@ -3,9 +3,12 @@ import tkinter as tk
 import threading
 import os
 from tkinter import filedialog
-from src.core.video_engine import VideoEngine
+from src.core.video_engine import VideoEngine, SEG_ENGINES
+from src.core.mask_cache import clear_sidecars
+from src.core.seq_writer import qoi_available
+from src.core.warmup import load_settings, remember
 from src.ui.widgets import CanvasPlayer
-from src.utils.config import C_PANEL, C_ACCENT, FONT_BOLD
+from src.utils.config import C_PANEL, C_ACCENT, FONT_BOLD, MATTING_MODES, MP_MODES, BG_METHODS, CHROMA_COLORS
 
 class VideoTab:
     def __init__(self, parent):
@@ -35,20 +38,85 @@ class VideoTab:
         f_pv.pack(fill="both", expand=True, padx=5, pady=5)
         self.player = CanvasPlayer(f_pv, self.frame, "wand_track") # Tracking mode
 
-        # Col 2: Settings
-        f_set = ctk.CTkFrame(self.frame, fg_color=C_PANEL)
-        f_set.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
+        # Col 2: Settings (scrollable; the run button stays outside so it is always on screen)
+        f_col = ctk.CTkFrame(self.frame, fg_color=C_PANEL)
+        f_col.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
         
-        ctk.CTkLabel(f_set, text="2. AJUSTES", font=FONT_BOLD, text_color=C_ACCENT).pack(pady=10)
+        ctk.CTkLabel(f_col, text="2. AJUSTES", font=FONT_BOLD, text_color=C_ACCENT).pack(pady=10)
+        self.btn_run = ctk.CTkButton(f_col, text="🚀 PROCESAR", fg_color=C_ACCENT, text_color="black", 
+                                     height=50, font=FONT_BOLD, command=self.run)
+        self.btn_run.pack(fill="x", padx=20, pady=20, side="bottom")
+        f_set = ctk.CTkScrollableFrame(f_col, fg_color="transparent")
+        f_set.pack(fill="both", expand=True, padx=5)
+        
+        # Engine (last-used selection, the same one warmed up at startup)
+        last = load_settings()
+        self.v_eng = ctk.StringVar(value=last["vid_engine"])
+        for txt, val in [("Magic Mode (Rembg)", "magic"), ("Turbo Mode (MediaPipe)", "turbo"), ("Cascade (MediaPipe + Rembg)", "cascade"),
+                         ("Fondo Estático (Trípode)", "bgsub"), ("Croma (Pantalla Verde/Azul)", "chroma")]:
+            ctk.CTkRadioButton(f_set, text=txt, variable=self.v_eng, value=val, command=self.show_engine_opts).pack(pady=5)
         
-        # Engine
-        self.v_eng = ctk.StringVar(value="magic")
-        ctk.CTkRadioButton(f_set, text="Magic Mode (Rembg)", variable=self.v_eng, value="magic").pack(pady=5)
-        ctk.CTkRadioButton(f_set, text="Turbo Mode (MediaPipe)", variable=self.v_eng, value="turbo").pack(pady=5)
+        # Engine-specific options: only the selected engine's groups are packed into f_eng
+        f_eng = ctk.CTkFrame(f_set, fg_color="transparent")
+        f_eng.pack(fill="x")
+        g_rembg, g_mp, g_matting, g_bg, g_key = [ctk.CTkFrame(f_eng, fg_color="transparent") for _ in range(5)]
+        self.eng_groups = {"magic": [g_rembg, g_matting], "cascade": [g_rembg, g_matting], "turbo": [g_mp, g_matting],
+                           "bgsub": [g_bg], "chroma": [g_key]}
         
-        self.v_model = ctk.CTkOptionMenu(f_set, values=["u2net", "isnet-anime", "u2net_human_seg"])
-        self.v_model.set("isnet-anime")
+        self.v_model = ctk.CTkOptionMenu(g_rembg, values=["u2net", "isnet-anime", "u2net_human_seg"])
+        self.v_model.set(last["vid_model"])
         self.v_model.pack(pady=5)
+        
+        ctk.CTkLabel(g_rembg, text="Lote de Inferencia (Rembg)").pack(pady=(5,0))
+        self.v_batch = ctk.CTkOptionMenu(g_rembg, values=["1", "2", "4", "8"])
+        self.v_batch.set("4")
+        self.v_batch.pack(pady=5)
+        
+        ctk.CTkLabel(g_bg, text="Modelo de Fondo (Estático)").pack(pady=(5,0))
+        self.v_bg = ctk.CTkOptionMenu(g_bg, values=list(BG_METHODS))
+        self.v_bg.set("Mediana Temporal")
+        self.v_bg.pack(pady=5)
+        
+        ctk.CTkLabel(g_key, text="Color de Croma").pack(pady=(5,0))
+        self.v_key = ctk.CTkOptionMenu(g_key, values=list(CHROMA_COLORS))
+        self.v_key.set("Verde")
+        self.v_key.pack(pady=5)
+        
+        ctk.CTkLabel(g_key, text="Tolerancia Croma").pack(pady=(5,0))
+        self.sl_tol = ctk.CTkSlider(g_key, from_=5, to=120, number_of_steps=23)
+        self.sl_tol.set(40)
+        self.sl_tol.pack(pady=5)
+        
+        ctk.CTkLabel(g_key, text="Suavidad de Borde (Croma)").pack(pady=(5,0))
+        self.sl_ksoft = ctk.CTkSlider(g_key, from_=1, to=80, number_of_steps=79)
+        self.sl_ksoft.set(30)
+        self.sl_ksoft.pack(pady=5)
+        
+        ctk.CTkLabel(g_key, text="Supresión de Derrame").pack(pady=(5,0))
+        self.sl_spill = ctk.CTkSlider(g_key, from_=0, to=1, number_of_steps=10)
+        self.sl_spill.set(1)
+        self.sl_spill.pack(pady=5)
+        
+        ctk.CTkLabel(g_mp, text="Modo MediaPipe").pack(pady=(5,0))
+        self.v_mp = ctk.CTkOptionMenu(g_mp, values=list(MP_MODES))
+        self.v_mp.set("Imagen (Paralelo)")
+        self.v_mp.pack(pady=5)
+        
+        ctk.CTkLabel(g_matting, text="Matting de Bordes").pack(pady=(10,0))
+        self.v_matting = ctk.CTkOptionMenu(g_matting, values=list(MATTING_MODES))
+        self.v_matting.set("Completo (Lento)")
+        self.v_matting.pack(pady=5)
+        self.show_engine_opts()
+        
+        ctk.CTkLabel(f_set, text="Segmentos Paralelos").pack(pady=(5,0))
+        self.v_chunks = ctk.CTkOptionMenu(f_set, values=["1", "2", "4", "8"])
+        self.v_chunks.set("1")
+        self.v_chunks.pack(pady=5)
+        
+        ctk.CTkLabel(f_set, text="Escala de Inferencia").pack(pady=(5,0))
+        self.v_scale = ctk.CTkOptionMenu(f_set, values=["1.0", "0.75", "0.5", "0.25"])
+        self.v_scale.set("1.0")
+        self.v_scale.pack(pady=5)
 
         # Sliders
         ctk.CTkLabel(f_set, text="Sensibilidad").pack(pady=(10,0))
@@ -60,6 +128,21 @@ class VideoTab:
         self.sl_soft = ctk.CTkSlider(f_set, from_=0, to=20, number_of_steps=20)
         self.sl_soft.set(5)
         self.sl_soft.pack(pady=5)
+        
+        ctk.CTkLabel(f_set, text="Estabilidad (Anti-Parpadeo)").pack(pady=(10,0))
+        self.sl_stab = ctk.CTkSlider(f_set, from_=0, to=0.9, number_of_steps=9)
+        self.sl_stab.set(0)
+        self.sl_stab.pack(pady=5)
+        
+        ctk.CTkLabel(f_set, text="Keyframe cada K cuadros").pack(pady=(10,0))
+        self.sl_key = ctk.CTkSlider(f_set, from_=1, to=15, number_of_steps=14)
+        self.sl_key.set(1)
+        self.sl_key.pack(pady=5)
+        
+        ctk.CTkLabel(f_set, text="Umbral de Deriva").pack(pady=(10,0))
+        self.sl_drift = ctk.CTkSlider(f_set, from_=0.02, to=0.3, number_of_steps=28)
+        self.sl_drift.set(0.08)
+        self.sl_drift.pack(pady=5)
 
         # Tracking Check
         self.chk_track = ctk.CTkSwitch(f_set, text="📍 Tracking (Puntos)", progress_color=C_ACCENT)
@@ -71,11 +154,15 @@ class VideoTab:
         ctk.CTkRadioButton(f_set, text="WebM (Transparente)", variable=self.v_fmt, value="webm").pack(anchor="w", padx=20)
         ctk.CTkRadioButton(f_set, text="MOV (PNG Codec)", variable=self.v_fmt, value="alpha").pack(anchor="w", padx=20)
         ctk.CTkRadioButton(f_set, text="Secuencia PNG", variable=self.v_fmt, value="png_seq").pack(anchor="w", padx=20)
+        ctk.CTkRadioButton(f_set, text="Secuencia TIFF (Sin Compresión)", variable=self.v_fmt, value="tiff_seq").pack(anchor="w", padx=20)
+        if qoi_available():
+            ctk.CTkRadioButton(f_set, text="Secuencia QOI (Rápida)", variable=self.v_fmt, value="qoi_seq").pack(anchor="w", padx=20)
         ctk.CTkRadioButton(f_set, text="Pantalla Verde", variable=self.v_fmt, value="green").pack(anchor="w", padx=20)
-
-        self.btn_run = ctk.CTkButton(f_set, text="🚀 PROCESAR", fg_color=C_ACCENT, text_color="black", 
-                                     height=50, font=FONT_BOLD, command=self.run)
-        self.btn_run.pack(fill="x", padx=20, pady=20, side="bottom")
+        
+        ctk.CTkLabel(f_set, text="Compresión PNG (0-9)").pack(pady=(5,0))
+        self.v_png = ctk.CTkOptionMenu(f_set, values=[str(i) for i in range(10)])
+        self.v_png.set("1")
+        self.v_png.pack(pady=5)
 
         # Col 3: Status
         f_stat = ctk.CTkFrame(self.frame, fg_color=C_PANEL)
@@ -89,6 +176,14 @@ class VideoTab:
         self.prog.set(0)
         self.prog.pack(fill="x", padx=20)
 
+        ctk.CTkButton(f_stat, text="🗑 Borrar Caché de Máscaras", fg_color="transparent", border_width=1,
+                      command=self.clear_cache).pack(side="bottom", pady=20)
+
+    def show_engine_opts(self):
+        groups = self.eng_groups.get(self.v_eng.get(), [])
+        for g in {g for gs in self.eng_groups.values() for g in gs}: g.pack_forget()
+        for g in groups: g.pack(fill="x")
+
     def load_file(self):
         f = filedialog.askopenfilename()
         if f:
@@ -106,6 +201,10 @@ class VideoTab:
         try: self.lbl_stat.configure(text=txt)
         except: pass
 
+    def clear_cache(self):
+        freed = clear_sidecars()
+        self.lbl_stat.configure(text=f"Caché liberada: {freed / (1 << 20):.0f} MB")
+
     def run(self):
         if not self.in_path: return
         self.btn_run.configure(state="disabled")
@@ -113,6 +212,7 @@ class VideoTab:
         def _t():
             soft = int(self.sl_soft.get()); soft = soft+1 if soft%2==0 else soft
             pts = self.player.points if self.chk_track.get() else None
+            remember(vid_engine=self.v_eng.get(), vid_model=self.v_model.get())
             
             res = self.engine.process_video(
                 self.in_path, 
@@ -122,7 +222,21 @@ class VideoTab:
                 wand_mode=self.chk_track.get(),
                 tracking_points=pts,
                 thresh=self.sl_thresh.get(),
-                soft=soft
+                soft=soft,
+                batch=int(self.v_batch.get()),
+                key_interval=int(self.sl_key.get()),
+                drift_thresh=self.sl_drift.get(),
+                infer_scale=float(self.v_scale.get()),
+                chunks=int(self.v_chunks.get()),
+                png_level=int(self.v_png.get()),
+                matting=MATTING_MODES[self.v_matting.get()] if self.v_eng.get() in SEG_ENGINES else "none", # Hidden group: no matting
+                mp_mode=MP_MODES[self.v_mp.get()],
+                bg_method=BG_METHODS[self.v_bg.get()],
+                key_color=CHROMA_COLORS[self.v_key.get()],
+                key_tol=int(self.sl_tol.get()),
+                key_soft=int(self.sl_ksoft.get()),
+                spill=self.sl_spill.get(),
+                stability=self.sl_stab.get()
             )
             
             self.btn_run.configure(state="normal")
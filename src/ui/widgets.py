@@ -8,6 +8,7 @@ import os
 import time
 from PIL import Image, ImageTk
 from src.utils.config import C_PANEL, C_ACCENT, FONT_BOLD
+from src.core.decoder import probe
 
 try:
     import pygame
@@ -47,7 +48,12 @@ class CanvasPlayer:
         self.points=[] # Video Wand Tracking points
         self.strokes=[] # Pencil strokes
         self.masks=[]   # Magic Wand flood masks
+        self.stroke_rng=[]; self.mask_rng=[] # Frame range (start, end) of each stroke/mask, None = whole video
+        self.cur_range=None # Range given to new strokes/masks
+        self.proposal=None # Auto-detected mask waiting for Accept/Discard (drawn, never exported)
+        self.cur_idx=0
         self.curr_fr=None
+        self.on_info=None # Called on the Tk thread once the exact frame count is known
         
         self.canvas.bind("<Button-1>", self.click)
         self.canvas.bind("<B1-Motion>", self.drag)
@@ -60,7 +66,7 @@ class CanvasPlayer:
         if self.mode=="wand_track": 
             self.points.append(self.map(e.x,e.y)); self.draw_ov()
         elif self.mode=="pencil": 
-            self.strokes.append([self.map(e.x,e.y)]); self.draw_ov()
+            self.strokes.append([self.map(e.x,e.y)]); self.stroke_rng.append(self.cur_range); self.draw_ov()
         elif self.mode=="flood":
              if self.curr_fr is None: return
              h, w = self.curr_fr.shape[:2]
@@ -78,14 +84,35 @@ class CanvasPlayer:
                  real_mask = mask[1:-1, 1:-1]
                  
                  if np.count_nonzero(real_mask) > 0:
-                     self.masks.append(real_mask)
+                     self.add_mask(real_mask)
                  else:
                      # Fallback Dot
                      fb = np.zeros((h, w), np.uint8)
                      cv2.circle(fb, (ix, iy), 15, 255, -1)
-                     self.masks.append(fb)
+                     self.add_mask(fb)
                  self.draw_ov()
 
+    def add_mask(self, m):
+        self.masks.append(m); self.mask_rng.append(self.cur_range)
+
+    def propose(self, m):
+        self.proposal = m; self.draw_ov()
+
+    def accept_proposal(self):
+        if self.proposal is not None: self.add_mask(self.proposal)
+        self.proposal = None; self.draw_ov()
+
+    def discard_proposal(self):
+        self.proposal = None; self.draw_ov()
+
+    def active(self, rng):
+        # Whether an item with this frame range shows on the current frame
+        return rng is None or (rng[0] <= self.cur_idx and (rng[1] is None or self.cur_idx < rng[1]))
+
+    def ranges(self):
+        # Distinct frame ranges in use (None = whole video)
+        return list(dict.fromkeys(self.stroke_rng + self.mask_rng))
+
     def drag(self, e):
         if self.mode=="wand_track": self.points.append(self.map(e.x,e.y)); self.draw_ov()
         elif self.mode=="pencil" and self.strokes: self.strokes[-1].append(self.map(e.x,e.y)); self.draw_ov()
@@ -117,9 +144,9 @@ class CanvasPlayer:
                 cx, cy = self.demap(*p)
                 self.canvas.create_oval(cx-3, cy-3, cx+3, cy+3, fill=C_ACCENT, outline=C_ACCENT, tags="ov")
 
-        # 2. Pencil Strokes
-        for s in self.strokes:
-            if len(s)>1:
+        # 2. Pencil Strokes (only the ones active on this frame)
+        for s, rng in zip(self.strokes, self.stroke_rng):
+            if len(s)>1 and self.active(rng):
                 flat=[]
                 for p in s: flat.extend(self.demap(*p))
                 self.canvas.create_line(flat, fill="red", width=5, capstyle="round", smooth=True, tags="ov")
@@ -128,29 +155,35 @@ class CanvasPlayer:
         h,w = 0,0
         if self.curr_fr is not None: h,w = self.curr_fr.shape[:2]
         
-        for m in self.masks:
-             cnts, _ = cv2.findContours(m, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-             for c in cnts:
-                 flat_poly = []
-                 for pt in c:
-                     px, py = pt[0]
-                     nx, ny = px/w, py/h
-                     cx, cy = self.demap(nx, ny)
-                     flat_poly.extend([cx, cy])
-                 
-                 if len(flat_poly) > 4:
-                     # Robust rendering for Linux (No stipple)
-                     self.canvas.create_polygon(flat_poly, outline=C_ACCENT, fill="", width=3, tags="ov")
+        for m, rng in zip(self.masks, self.mask_rng):
+             if self.active(rng): self._draw_mask(m, w, h, C_ACCENT)
+
+        # 4. Pending auto-detection (dashed, until accepted)
+        if self.proposal is not None: self._draw_mask(self.proposal, w, h, "yellow", dash=(6, 4))
 
-    def get_mask(self, w, h):
+    def _draw_mask(self, m, w, h, color, dash=None):
+        cnts, _ = cv2.findContours(m, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for c in cnts:
+            flat_poly = []
+            for pt in c:
+                px, py = pt[0]
+                flat_poly.extend(self.demap(px/w, py/h))
+            if len(flat_poly) > 4:
+                # Robust rendering for Linux (No stipple)
+                self.canvas.create_polygon(flat_poly, outline=color, fill="", width=3, dash=dash, tags="ov")
+
+    def get_mask(self, w, h, rng=False):
+        # rng: only the strokes/masks tied to that frame range (default: all of them)
         m = np.zeros((h, w), dtype=np.uint8)
         # Pencil
-        for s in self.strokes:
+        for s, r in zip(self.strokes, self.stroke_rng):
+            if rng is not False and r != rng: continue
             pts = np.array([(int(p[0]*w), int(p[1]*h)) for p in s], np.int32)
             if len(pts)>1: cv2.polylines(m, [pts], False, 255, 20)
             
         # Wand
-        for bm in self.masks:
+        for bm, r in zip(self.masks, self.mask_rng):
+            if rng is not False and r != rng: continue
             if bm.shape[:2] != (h, w):
                 bm_resized = cv2.resize(bm, (w, h), interpolation=cv2.INTER_NEAREST)
                 m = cv2.bitwise_or(m, bm_resized)
@@ -179,20 +212,34 @@ class CanvasPlayer:
 
     def load(self, p): 
         self.stop(); self.path=p; self.points=[]; self.strokes=[]; self.masks=[]
+        self.stroke_rng=[]; self.mask_rng=[]; self.cur_idx=0; self.proposal=None
         self.cap = cv2.VideoCapture(p)
+        # Timeline from cv2's estimate right away; the exact count (a full demux) is probed in the background
         self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        threading.Thread(target=self._probe, args=(p,), daemon=True).start()
         ret, frame = self.cap.read()
         if ret: 
             self.canvas.update()
             self.show(frame)
 
+    def _probe(self, p):
+        info = probe(p)
+        def _apply():
+            if self.path != p: return # Another file was loaded meanwhile
+            self.total_frames = info["frames"] or self.total_frames
+            self.fps = info["fps"]
+            if self.on_info: self.on_info()
+        try: self.app.after(0, _apply)
+        except: pass
+
     def seek(self, frame_idx):
         if not self.path: return
         # Ensure cap is open
         if not self.cap or not self.cap.isOpened():
              self.cap = cv2.VideoCapture(self.path)
         
+        self.cur_idx = frame_idx
         self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
         ret, frame = self.cap.read()
         if ret:
@@ -229,7 +276,8 @@ class CanvasPlayer:
                 self.stop()
                 break
             
-            try: self.app.after(0, lambda: self.show(f))
+            self.cur_idx += 1 # Range overlays and buttons follow playback
+            try: self.app.after(0, lambda f=f: self.show(f))
             except: break
             
             wt=d-(time.time()-s)
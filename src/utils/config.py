@@ -14,6 +14,41 @@ FONT_MAIN = ("Roboto", 12)
 FONT_BOLD = ("Roboto", 12, "bold")
 FONT_TITLE = ("Roboto", 24, "bold")
 
+# --- OPCIONES DE MATTING / MATTING OPTIONS ---
+# Etiqueta visible -> modo del motor (VideoEngine / ImageEngine)
+MATTING_MODES = {
+    "Completo (Lento)": "full",
+    "Rápido (Borde)": "band",
+    "Ninguno": "none",
+}
+
+# MediaPipe running mode for the Turbo engine
+MP_MODES = {
+    "Imagen (Paralelo)": "image",
+    "Video (Temporal)": "video",
+    "Directo (Async)": "live",
+}
+
+# Background model for the static-camera engine
+BG_METHODS = {
+    "Mediana Temporal": "median",
+    "MOG2": "mog2",
+    "KNN": "knn",
+}
+
+# Screen color for the chroma-key engine
+CHROMA_COLORS = {
+    "Verde": "green",
+    "Azul": "blue",
+}
+
+# Inpainting tier for the watermark remover
+INPAINT_ALGOS = {
+    "Difusión (Telea)": "telea",
+    "Difusión (Navier-Stokes)": "ns",
+    "Temporal (Cámara en Movimiento)": "temporal",
+}
+
 # --- LOCALIZACIÓN / LOCALIZATION ---
 LOCALES = {
     "ES": {
@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+from src.core.temporal_fill import TemporalFill
+from src.core.remover_process import mask_rois, RADIUS
+
+class FrameList:
+    # cap.read() over prepared frames
+    def __init__(self, frames): self.frames = list(frames)
+    def read(self, buf=None):
+        return (True, self.frames.pop(0).copy()) if self.frames else (False, None)
+
+def test_ranged_masks():
+    # Static shot, masked interval then an unmasked one (None): the holes never fill from the
+    # plate, so the lookahead reaches into the unmasked frames
+    rng = np.random.default_rng(0)
+    bg = cv2.GaussianBlur(rng.integers(0, 255, (240, 320, 3), np.uint8), (0, 0), 3)
+    frames = [bg] * 40
+    m = np.zeros((240, 320), np.uint8)
+    cv2.rectangle(m, (250, 20), (300, 50), 255, -1)
+    fill = TemporalFill([m, None], [mask_rois(m, RADIUS + 1), []], m.shape)
+    out = list(fill.frames(FrameList(frames), [0, 20]))
+    assert [i for i, _, _ in out] == list(range(40))
+    assert [k for _, k, _ in out] == [0] * 20 + [1] * 20
+    # Unmasked frames come out untouched
+    assert all(np.array_equal(f, frames[i]) for i, k, f in out if k == 1)
+
+if __name__ == "__main__":
+    test_ranged_masks()
+    print("OK")